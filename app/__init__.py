@@ -15,6 +15,20 @@ def create_app(config_name):
     bootstrap.init_app(app)
 
     db.init_app(app)
+    from . import models
+    with app.app_context():
+        db.create_all()
+        # With gunicorn's preload_app the app is created before the workers
+        # are forked, they must not share the connections of the master.
+        db.engine.dispose()
+
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
+
+    # Runs before the app is returned, so before any request is served.
+    from .warmup import STATUS, warm_up
+    if app.config['WARM_UP']:
+        warm_up()
+    else:
+        STATUS.update(state='disabled', error=None)
     return app
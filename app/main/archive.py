@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from hashlib import md5
+from threading import Lock
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+import os
+
+CHUNK_SIZE = 64 * 1024
+
+# Size of the archives already generated, by ETag. It is only needed to
+# answer range requests, so only the MAX_SIZES most recent are kept.
+SIZES = OrderedDict()
+MAX_SIZES = 1024
+SIZES_LOCK = Lock()
+
+
+class ChunkWriter():
+    """Unseekable file object that keeps what is written to it until it is
+    taken with pop. ZipFile then writes data descriptors after each file
+    instead of seeking back to its header."""
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def archive_entries(files, root):
+    """The (path, arcname) of the files that exist, with arcname relative
+    to root."""
+    entries = []
+    for file in files:
+        path = os.path.join(root, file)
+        if os.path.isfile(path):
+            entries.append((path, os.path.relpath(file, 'uploaded')))
+    return entries
+
+
+def archive_etag(entries):
+    """ETag of the archive of the entries, from their names, sizes and
+    modification times."""
+    digest = md5()
+    for path, arcname in entries:
+        stat = os.stat(path)
+        digest.update(f"{arcname}:{stat.st_size}:{stat.st_mtime_ns};"
+                      .encode())
+    return digest.hexdigest()
+
+
+def stream_archive(entries, etag=None):
+    """Generates a zip archive of the entries chunk by chunk, reading each
+    file in chunks of CHUNK_SIZE. The same files always give the same bytes,
+    so ranges of the archive can be served by generating it again.
+
+    :param entries: list of (path, arcname).
+    :param etag: if given, the size of the archive is stored in SIZES.
+    """
+    writer = ChunkWriter()
+    with ZipFile(writer, "w", ZIP_DEFLATED) as zipfile:
+        for path, arcname in entries:
+            info = ZipInfo.from_file(path, arcname)
+            info.compress_type = ZIP_DEFLATED
+            with open(path, "rb") as src, zipfile.open(info, "w") as dest:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    dest.write(chunk)
+                    yield writer.pop()
+            yield writer.pop()
+    yield writer.pop()
+    if etag is not None:
+        remember_size(etag, writer.size)
+
+
+def remember_size(etag, size):
+    """Stores the size of the archive with etag, forgetting the least
+    recently used sizes beyond MAX_SIZES."""
+    with SIZES_LOCK:
+        SIZES[etag] = size
+        SIZES.move_to_end(etag)
+        while len(SIZES) > MAX_SIZES:
+            SIZES.popitem(last=False)
+
+
+def known_size(etag):
+    """Size of the archive with etag if it was already generated, or
+    None."""
+    with SIZES_LOCK:
+        if etag not in SIZES:
+            return None
+        SIZES.move_to_end(etag)
+        return SIZES[etag]
+
+
+def archive_size(entries, etag):
+    """Size of the archive of the entries, generating it once if it is not
+    known."""
+    size = known_size(etag)
+    if size is None:
+        size = sum(len(chunk) for chunk in stream_archive(entries))
+        remember_size(etag, size)
+    return size
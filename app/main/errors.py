@@ -7,6 +7,11 @@ def page_not_found(e):
     return render_template('404.html'), 404
 
 
+@main.app_errorhandler(413)
+def request_entity_too_large(e):
+    return render_template('413.html'), 413
+
+
 @main.app_errorhandler(500)
 def internal_server_error(e):
     return render_template('500.html'), 500
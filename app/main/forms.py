@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileAllowed, FileRequired
 from wtforms import SubmitField, FileField, RadioField
+from spectranalyzer.presets import PRESETS
 # from wtforms.validators import
 
 
@@ -10,6 +11,9 @@ class NameForm(FlaskForm):
                                       FileAllowed(['csv'],
                                                   message='Must\
                                                   be a csv file')])
-    fitter = RadioField('Fitter', choices=[('1', 'Laurdan'), ('2', 'MC540')],
-                        default='1')
+    fitter = RadioField('Fitter',
+                        choices=[(name, PRESETS[name].label)
+                                 for name in ('Laurdan', 'MC540-Water',
+                                              'MC540-Interphase')],
+                        default='Laurdan')
     submit = SubmitField('Submit')
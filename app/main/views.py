@@ -1,13 +1,15 @@
-from flask import render_template, url_for, request
+from flask import render_template, url_for, request, redirect, Response, \
+    current_app, abort, jsonify
 from werkzeug.utils import secure_filename
 from . import main
 from .forms import NameForm
+from .archive import archive_entries, archive_etag, archive_size, \
+    known_size, stream_archive
 import os
-# from .. import db
-# from ..models import User
-from spectranalyzer import LaurdanFitter
-from zipfile import ZipFile
-from glob import glob
+import uuid
+from .. import db
+from ..models import FitRun
+from spectranalyzer.batch import FITTERS
 
 
 @main.route('/')
@@ -15,6 +17,15 @@ def index():
     return render_template('index.html')
 
 
+@main.route('/health')
+def health():
+    """200 once the app has been warmed up, 503 while it is not (including
+    when WARM_UP is disabled) or if the warm-up failed."""
+    from ..warmup import STATUS
+    code = 200 if STATUS['state'] == 'ready' else 503
+    return jsonify(status=STATUS['state'], error=STATUS['error']), code
+
+
 @main.route('/sendfile', methods=['GET', 'POST'])
 def sendfile():
     form = NameForm()
@@ -23,32 +34,107 @@ def sendfile():
         print(form.fitter.data)
         print(request.files)
         f = form.filefield.data
-        filepath = (
-            f"""{main.root_path}{os.path.sep}.."""
-            f"""{os.path.sep}static{os.path.sep}"""
-            f"""uploaded{os.path.sep}""")
+        # Every run has its own directory, so runs of files with the same
+        # name do not overwrite each other's outputs.
+        rundir = f"uploaded/{uuid.uuid4().hex}"
+        filepath = os.path.join(current_app.static_folder, *rundir.split("/"))
+        os.makedirs(filepath)
         filename = f"{secure_filename(f.filename)}"
-        f.save(f"{filepath}{filename}")
+        save_upload(f, os.path.join(filepath, filename),
+                    current_app.config['UPLOAD_CHUNK_SIZE'])
+        cwd = os.getcwd()
         os.chdir(filepath)
-        fitter = LaurdanFitter(filename)
-        fitter.fit_all_columns(export=True, write_images=True)
-        zipfile = ZipFile(f"{filepath}{fitter.name}.zip", "w")
-        zipdir(f"{fitter.name}", zipfile)
-        zipfile.write(filename)
-        zipfile.close()
-        os.chdir("..")
-        url = url_for('static', filename=f"{fitter.name}.zip")
-        imgs = []
-        for file in sorted(glob(f"{filepath}{fitter.name}/*.png")):
-            file = os.path.sep.join(file.split(os.path.sep)[-2:])
-            imgs.append(url_for('static',
-                                filename=f"uploaded{os.path.sep}{file}"))
-        return render_template('result.html', url=url, imgs=imgs)
-        # f"<a href={url}>link</a>"  # redirect(url_for('.index'))
+        try:
+            fitter_class, kwargs = FITTERS[form.fitter.data]
+            fitter = fitter_class(filename.replace(".csv", ""))
+            fitter.load_file(filename,
+                             chunksize=current_app.config['CSV_CHUNK_ROWS'])
+            fitter.fit_all_columns(export=True, write_images=True, **kwargs)
+            files = [filename] + list_files(fitter.name)
+        finally:
+            os.chdir(cwd)
+        files = [f"{rundir}/{file}".replace(os.path.sep, "/")
+                 for file in files]
+        run = FitRun.from_fitter(fitter, form.fitter.data, filename, files)
+        db.session.add(run)
+        db.session.commit()
+        return redirect(url_for('.result', id=run.id))
     return render_template('sendfile.html', form=form)
 
 
-def zipdir(path, ziph):
+@main.route('/result/<int:id>')
+def result(id):
+    run = FitRun.query.get_or_404(id)
+    url = url_for('.archive', id=run.id)
+    imgs = [url_for('static', filename=file.path) for file in run.images()]
+    return render_template('result.html', url=url, imgs=imgs, run=run)
+
+
+@main.route('/result/<int:id>/report.csv')
+def report(id):
+    run = FitRun.query.get_or_404(id)
+    return Response(run.report_dataframe().to_csv(), mimetype='text/csv',
+                    headers={'Content-Disposition':
+                             f'attachment; filename={run.name}-report.csv'})
+
+
+@main.route('/results')
+def results():
+    query = FitRun.query
+    preset = request.args.get('preset')
+    name = request.args.get('name')
+    if preset:
+        query = query.filter_by(preset=preset)
+    if name:
+        query = query.filter(FitRun.name.contains(name))
+    runs = query.order_by(FitRun.created.desc()).limit(100).all()
+    return render_template('results.html', runs=runs, preset=preset,
+                           name=name)
+
+
+@main.route('/result/<int:id>/archive.zip')
+def archive(id):
+    """Streams the zip archive of the output files of a run. It is not
+    stored anywhere: it is generated on each download, and repeated
+    downloads are answered from the ETag."""
+    run = FitRun.query.get_or_404(id)
+    entries = archive_entries([file.path for file in run.files],
+                              current_app.static_folder)
+    etag = archive_etag(entries)
+    if request.range:
+        size = archive_size(entries, etag)
+    else:
+        size = known_size(etag)
+    response = Response(stream_archive(entries, etag),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename={run.name}.zip'
+    response.set_etag(etag)
+    response.last_modified = run.created
+    response.cache_control.private = True
+    response.cache_control.max_age = 3600
+    if size is not None:
+        response.content_length = size
+    return response.make_conditional(request, accept_ranges=True,
+                                     complete_length=size)
+
+
+def save_upload(storage, path, chunk_size):
+    """Copies an uploaded file to path chunk_size bytes at a time.
+
+    Werkzeug has already spooled the request body to a temporary file (and
+    rejected it with 413 if larger than MAX_CONTENT_LENGTH), so this only
+    avoids reading the whole upload into memory while copying it.
+    """
+    with open(path, "wb") as dest:
+        for chunk in iter(lambda: storage.stream.read(chunk_size), b""):
+            dest.write(chunk)
+
+
+def list_files(path):
+    """Paths of every file under path."""
+    listed = []
     for root, _, files in os.walk(path):
         for file in files:
-            ziph.write(os.path.join(root, file))
+            listed.append(os.path.join(root, file))
+    return listed
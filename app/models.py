@@ -0,0 +1,116 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from . import db
+
+
+class FitRun(db.Model):
+    """A fitted file: one row per upload, with its columns and output
+    files."""
+    __tablename__ = 'fit_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128), index=True)
+    preset = db.Column(db.String(64), index=True)
+    filename = db.Column(db.String(256))
+    created = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    columns = db.relationship('ColumnFit', backref='run', lazy='dynamic',
+                              order_by='ColumnFit.position',
+                              cascade='all, delete-orphan')
+    files = db.relationship('ResultFile', backref='run', lazy='dynamic',
+                            order_by='ResultFile.path',
+                            cascade='all, delete-orphan')
+
+    @staticmethod
+    def from_fitter(fitter, preset, filename, files=()):
+        """Creates a run with the parameters and the report of every fit of
+        a LaurdanFitter or MeroFitter.
+
+        :param fitter: the fitter, after fit_all_columns.
+        :param preset: the name of the preset used.
+        :param filename: the uploaded file.
+        :param files: the output files, relative to the static folder.
+        """
+        run = FitRun(name=fitter.name, preset=preset, filename=filename)
+        for position, fit in enumerate(fitter.fits):
+            column = str(fit.data.name)
+            out = fit.out
+            columnfit = ColumnFit(column=column, position=position,
+                                  chisqr=float(out.chisqr))
+            for name, param in out.params.items():
+                columnfit.parameters.append(Parameter(
+                    name=name, value=float(param.value),
+                    stderr=None if param.stderr is None
+                    else float(param.stderr),
+                    vary=param.vary))
+            for quantity, value in fitter.report.loc[fit.data.name].items():
+                if np.isfinite(value):
+                    columnfit.report.append(ReportValue(
+                        quantity=quantity, value=float(value)))
+            run.columns.append(columnfit)
+        for path in files:
+            run.files.append(ResultFile(path=path))
+        return run
+
+    def report_dataframe(self):
+        """The report of the run, one row per column, as written by the
+        fitter."""
+        rows = {}
+        for columnfit in self.columns:
+            rows[columnfit.column] = {value.quantity: value.value
+                                      for value in columnfit.report}
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+    def images(self):
+        return self.files.filter(ResultFile.path.like('%.png'))
+
+    def __repr__(self):
+        return f'<FitRun {self.id} {self.name}>'
+
+
+class ColumnFit(db.Model):
+    """The fit of one column (spectrum) of a run."""
+    __tablename__ = 'column_fits'
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('fit_runs.id'), index=True)
+    column = db.Column(db.String(64), index=True)
+    position = db.Column(db.Integer)
+    chisqr = db.Column(db.Float)
+    parameters = db.relationship('Parameter', backref='fit', lazy='dynamic',
+                                 order_by='Parameter.id',
+                                 cascade='all, delete-orphan')
+    report = db.relationship('ReportValue', backref='fit', lazy='dynamic',
+                             order_by='ReportValue.id',
+                             cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<ColumnFit {self.run_id} {self.column}>'
+
+
+class Parameter(db.Model):
+    """A fitted parameter of a column, named as in LNFitter.params."""
+    __tablename__ = 'parameters'
+    id = db.Column(db.Integer, primary_key=True)
+    fit_id = db.Column(db.Integer, db.ForeignKey('column_fits.id'),
+                       index=True)
+    name = db.Column(db.String(64), index=True)
+    value = db.Column(db.Float)
+    stderr = db.Column(db.Float)
+    vary = db.Column(db.Boolean)
+
+
+class ReportValue(db.Model):
+    """A value of the report row of a column."""
+    __tablename__ = 'report_values'
+    id = db.Column(db.Integer, primary_key=True)
+    fit_id = db.Column(db.Integer, db.ForeignKey('column_fits.id'),
+                       index=True)
+    quantity = db.Column(db.String(64), index=True)
+    value = db.Column(db.Float)
+
+
+class ResultFile(db.Model):
+    """An output file of a run, relative to the static folder."""
+    __tablename__ = 'result_files'
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('fit_runs.id'), index=True)
+    path = db.Column(db.String(512))
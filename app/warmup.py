@@ -0,0 +1,47 @@
+import io
+import logging
+
+# State of the warm-up of this process, reported by /health: "pending"
+# until warm_up has run, then "ready", or "failed" with the error.
+# create_app sets it to "disabled" when the config disables WARM_UP.
+STATUS = {'state': 'pending', 'error': None}
+
+
+def warm_up():
+    """Loads everything the first fit would: the water reference, the
+    matplotlib fonts, and the code paths of a fit and its figure. With
+    gunicorn's preload_app it runs once, before the workers are forked.
+    A failure is logged and recorded in STATUS instead of raised."""
+    try:
+        exercise()
+    except Exception as error:
+        logging.getLogger(__name__).exception("Warm-up failed")
+        STATUS.update(state='failed', error=repr(error))
+    else:
+        STATUS.update(state='ready', error=None)
+
+
+def exercise():
+    import numpy as np
+    import pandas as pd
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from spectranalyzer.lnfitter import LNFitter
+    from spectranalyzer.lnmodel import lognormal
+    from spectranalyzer.presets import PRESETS
+    from spectranalyzer.water import WaterLN
+
+    WaterLN.load_reference()
+
+    x = np.arange(400., 600., 2.)
+    y = lognormal(x, 1., 490.) + lognormal(x, .5, 440.)
+    spectrum = pd.Series(y, index=x, name="warmup")
+    for name in ('Laurdan', 'MC540-Water', 'MC540-Interphase'):
+        LNFitter.from_preset(spectrum, PRESETS[name]).fit()
+
+    pd.DataFrame({"warmup": y}, index=x).plot()
+    plt.xlabel("Wavelength (nm)")
+    plt.ylabel("Intensity (a.u.)")
+    plt.savefig(io.BytesIO(), format="png")
+    plt.close('all')
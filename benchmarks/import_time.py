@@ -0,0 +1,61 @@
+"""Import time of spectranalyzer, measured in fresh interpreters.
+
+    python benchmarks/import_time.py [--repeat 5]
+
+For each statement, prints the best and median wall time of running it
+in a new process, and which of the heavy dependencies it loaded. The
+numpy + pandas line is the floor: Spectra can not load faster than that.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = [
+    ("numpy + pandas", "import numpy, pandas"),
+    ("import spectranalyzer", "import spectranalyzer"),
+    ("Spectra", "from spectranalyzer import Spectra"),
+    ("LaurdanFitter", "from spectranalyzer import LaurdanFitter"),
+    ("first fitter", "import pandas; from spectranalyzer import LNFitter; "
+                     "LNFitter(pandas.Series(dtype=float), 2)"),
+]
+
+HEAVY = ("matplotlib", "scipy", "lmfit")
+
+PROGRAM = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure(statement, repeat):
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c",
+             PROGRAM.format(statement=statement, heavy=HEAVY)],
+            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        elapsed, loaded = (out.split() + [""])[:2]
+        times.append(float(elapsed))
+    return min(times), statistics.median(times), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(f"{'Statement':<24}{'Best (s)':>10}{'Median (s)':>12}  Loaded")
+    for label, statement in STATEMENTS:
+        best, median, loaded = measure(statement, args.repeat)
+        print(f"{label:<24}{best:>10.3f}{median:>12.3f}  {loaded or '-'}")
+
+
+if __name__ == "__main__":
+    main()
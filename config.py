@@ -5,6 +5,23 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'lasdñjkhdsfaskdf'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Uploads larger than this are rejected with 413 by werkzeug.
+    MAX_CONTENT_LENGTH = int(os.environ.get('UPLOAD_MAX_BYTES') or
+                             256 * 1024 * 1024)
+    # Bytes copied from the upload to disk at a time.
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE') or
+                            1024 * 1024)
+    # Rows of the uploaded CSV parsed at a time.
+    CSV_CHUNK_ROWS = int(os.environ.get('CSV_CHUNK_ROWS') or 10000)
+    # Import and exercise the fitting stack before serving requests.
+    WARM_UP = os.environ.get('WARM_UP', '0') == '1'
+    # Read by gunicorn.conf.py. The workers must be processes: sendfile
+    # changes the working directory and draws with pyplot, so requests
+    # can not share a process.
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS') or
+                           2 * (os.cpu_count() or 1) + 1)
+    GUNICORN_WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS') or 'sync'
+    GUNICORN_TIMEOUT = int(os.environ.get('GUNICORN_TIMEOUT') or 300)
 
     @staticmethod
     def init_app(app):
@@ -17,7 +34,14 @@ class DevelopmentConfig(Config):
         'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
 
 
+class ProductionConfig(Config):
+    WARM_UP = os.environ.get('WARM_UP', '1') == '1'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+        'sqlite:///' + os.path.join(basedir, 'data.sqlite')
+
+
 config = {
     'development': DevelopmentConfig,
+    'production': ProductionConfig,
     'default': DevelopmentConfig
 }
@@ -0,0 +1,14 @@
+# Production settings for gunicorn, read from config.py:
+#     gunicorn -c gunicorn.conf.py webapp:app
+import os
+from config import config
+
+settings = config[os.getenv('FLASK_CONFIG') or 'default']
+
+bind = os.environ.get('GUNICORN_BIND') or '0.0.0.0:8000'
+workers = settings.GUNICORN_WORKERS
+worker_class = settings.GUNICORN_WORKER_CLASS
+timeout = settings.GUNICORN_TIMEOUT
+# Import and warm up the app once in the master, so the workers are forked
+# with the fitting stack already loaded.
+preload_app = True
@@ -5,4 +5,8 @@ setup(name='SpectrAnalyzer',
       description='Perform Analysis and Fitting of Spectra',
       author='Rodrigo E. Gimenez',
       packages=['spectranalyzer'],
-      install_requires=['lmfit','matplotlib','pandas'])
+      package_data={'spectranalyzer': ['normagua.csv']},
+      install_requires=['lmfit','matplotlib','pandas'],
+      entry_points={
+          'console_scripts': ['spectranalyzer=spectranalyzer.cli:main'],
+      })
@@ -16,10 +16,41 @@
 # from .helpers import *
 # from .spectrabuilder import SpectraBuilder
 
-from .lnfun import LNFun
-from .multiln import MultiLN
-from .lnfitter import LNFitter
-from .laurdanfitter import LaurdanFitter
-from .merofitter import MeroFitter
-from .spectra import Spectra
-from .fitter import Fitter
+import importlib
+
+# The public names and the module that defines each one. They are imported
+# on first use, so that "import spectranalyzer" stays cheap and using, for
+# instance, Spectra does not import the fitters.
+_EXPORTS = {
+    'LNFun': 'lnfun',
+    'MultiLN': 'multiln',
+    'LNFitter': 'lnfitter',
+    'LaurdanFitter': 'laurdanfitter',
+    'MeroFitter': 'merofitter',
+    'Spectra': 'spectra',
+    'Fitter': 'fitter',
+    'ReportBuilder': 'report',
+    'ParamList': 'paramlist',
+    'ModelPreset': 'presets',
+    'get_preset': 'presets',
+    'register_preset': 'presets',
+    'pack_results': 'serialization',
+    'unpack_results': 'serialization',
+    'write_results': 'serialization',
+    'read_results': 'serialization',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__),
+                    name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,184 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Batch processing of experiments found in a directory tree."""
+
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob, escape
+import json
+import os
+import time
+from .laurdanfitter import LaurdanFitter
+from .merofitter import MeroFitter
+from .lazy import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
+
+# Fitter class and fit_all_columns arguments for each preset.
+FITTERS = {
+    'Laurdan': (LaurdanFitter, {}),
+    'MC540-Water': (MeroFitter, {}),
+    'MC540-Interphase': (MeroFitter, {'interphase': True}),
+}
+
+
+class Experiment():
+    """An experiment to process: its input CSV files, all in directory,
+    and the name of the fitter, which is also the name of the output
+    directory, created inside directory.
+    """
+    def __init__(self, directory, name, inputs):
+        self.directory = directory
+        self.name = name
+        self.inputs = inputs
+
+    @property
+    def report(self):
+        return os.path.join(self.directory, self.name,
+                            f"{self.name}-report.csv")
+
+    @property
+    def options(self):
+        """The file with the preset and options of the last run."""
+        return os.path.join(self.directory, self.name,
+                            f"{self.name}-options.json")
+
+    def write_options(self, options):
+        with open(self.options, "w") as file:
+            json.dump(options, file, sort_keys=True)
+
+    def is_up_to_date(self, options=None):
+        """True if the report is newer than every input file and, if given,
+        the last run used the same preset and options."""
+        try:
+            mtime = os.path.getmtime(self.report)
+        except OSError:
+            return False
+        if options is not None:
+            try:
+                with open(self.options) as file:
+                    if json.load(file) != options:
+                        return False
+            except (OSError, ValueError):
+                return False
+        return all(os.path.getmtime(file) < mtime for file in self.inputs)
+
+
+def find_experiments(root, wavelength=None):
+    """Finds the experiments in a directory tree.
+
+    With a wavelength, every directory holding "*<wavelength>.csv" files is
+    one experiment, read with Spectra.load_csv_data and named after the
+    directory. Without it, every CSV file is an experiment with the matrix
+    of spectra, read with Spectra.load_file and named after the file.
+    The output directories of the experiments are not searched.
+
+    :param root: the directory to search.
+    :param wavelength: the wavelength of the series. (Default value = None)
+    """
+    experiments = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if wavelength is not None:
+            inputs = sorted(glob(os.path.join(escape(directory),
+                                              f"*{wavelength}.csv")))
+            names = [os.path.basename(os.path.abspath(directory))]
+            if inputs:
+                experiments.append(Experiment(directory, names[0], inputs))
+        else:
+            inputs = sorted(name for name in filenames
+                            if name.lower().endswith(".csv"))
+            names = [name[:-4] for name in inputs]
+            for name, file in zip(names, inputs):
+                experiments.append(Experiment(directory, name,
+                                              [os.path.join(directory,
+                                                            file)]))
+        if inputs:
+            dirnames[:] = [name for name in dirnames if name not in names]
+    return experiments
+
+
+def run_experiment(experiment, preset="Laurdan", wavelength=None, regex=None,
+                   write_images=False, starts=1):
+    """Imports, fits, reports and exports an experiment.
+
+    :returns: the number of fitted columns.
+    """
+    fitter_class, kwargs = FITTERS[preset]
+    cwd = os.getcwd()
+    os.chdir(experiment.directory)
+    try:
+        fitter = fitter_class(experiment.name)
+        if wavelength is None:
+            fitter.load_file(os.path.basename(experiment.inputs[0]))
+        else:
+            fitter.load_csv_data(wavelength, basedir=f".{os.path.sep}",
+                                 regex=regex)
+        fitter.fit_all_columns(export=True, write_images=write_images,
+                               starts=starts, **kwargs)
+        plt.close('all')
+    finally:
+        os.chdir(cwd)
+    experiment.write_options(run_options(preset, wavelength, regex,
+                                         write_images, starts))
+    return len(fitter.fits)
+
+
+def run_options(preset="Laurdan", wavelength=None, regex=None,
+                write_images=False, starts=1):
+    """The options of run_experiment, as stored next to the report."""
+    return {"preset": preset, "wavelength": wavelength, "regex": regex,
+            "write_images": write_images, "starts": starts}
+
+
+def timed_run(experiment, **kwargs):
+    """Runs an experiment and returns its status, the number of fitted
+    columns and the time it took. Errors are returned as the status."""
+    start = time.perf_counter()
+    try:
+        columns = run_experiment(experiment, **kwargs)
+        status = "done"
+    except Exception as e:
+        columns = 0
+        status = f"failed: {e!r}"
+    return status, columns, time.perf_counter() - start
+
+
+def run_all(experiments, jobs=1, force=False, **kwargs):
+    """Runs every experiment that is not up to date, in jobs processes.
+
+    :param experiments: list of Experiment.
+    :param jobs: number of worker processes. (Default value = 1)
+    :param force: also run the experiments that are up to date, that is,
+                  whose report is newer than their inputs and was made
+                  with the same preset and options. (Default value = False)
+    :param kwargs: passed to run_experiment.
+    :returns: list of (experiment, status, columns, seconds).
+    """
+    options = run_options(**kwargs)
+    pending = [experiment for experiment in experiments
+               if force or not experiment.is_up_to_date(options)]
+    results = {experiment: ("skipped", 0, 0.) for experiment in experiments}
+    if jobs > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(timed_run, experiment, **kwargs)
+                       for experiment in pending]
+            for experiment, future in zip(pending, futures):
+                results[experiment] = future.result()
+    else:
+        for experiment in pending:
+            results[experiment] = timed_run(experiment, **kwargs)
+    return [(experiment,) + results[experiment]
+            for experiment in experiments]
@@ -0,0 +1,222 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Per-column processing of wide matrices in blocks of columns.
+
+The spectra, and the blank if any, are copied once to shared memory as
+(columns, points) arrays, so every block of columns is contiguous. The
+workers only receive the names of the shared blocks and the range of
+columns to process, subtract the blank, normalize, track the peaks and fit
+their columns, and write the processed spectra back to shared memory. Only
+the peaks and the report rows are sent back and merged in column order.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import copy
+import math
+import numpy as np
+import pandas as pd
+from . import peaks as peakfinder
+from .lazy import lazy_import
+
+interpolate = lazy_import("scipy.interpolate")
+
+
+class SharedMatrix():
+    """A float64 array in shared memory.
+
+    :param shape: the shape of the array.
+    :param name: the name of an existing block to attach to. If None, a
+                 new block is created. (Default value = None)
+    """
+    def __init__(self, shape, name=None):
+        self.shape = tuple(shape)
+        size = max(int(np.prod(self.shape)) * 8, 1)
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.array = np.ndarray(self.shape, dtype=float,
+                                buffer=self.memory.buf)
+
+    @classmethod
+    def from_array(cls, array):
+        shared = cls(np.shape(array))
+        shared.array[...] = array
+        return shared
+
+    def close(self):
+        self.array = None
+        self.memory.close()
+
+    def unlink(self):
+        self.close()
+        self.memory.unlink()
+
+
+def template(spectra):
+    """A copy of spectra without its data and results, sent to the
+    workers to fit their columns."""
+    template = copy.copy(spectra)
+    template.data = None
+    template.normdata = None
+    template.weights = None
+    template.rawdata = None
+    template.smoothed = None
+    template.sd = None
+    template.counts = None
+    template.label_fun = None
+    if hasattr(template, "fits"):
+        template.fits = []
+        template.report_builder = None
+    return template
+
+
+def process_block(task):
+    """Processes the columns start:stop. Runs in the workers.
+
+    :param task: dict with the names and shapes of the shared blocks, the
+                 wavelengths and the options given to process.
+    :returns: (start, peaks DataFrame or None, report DataFrame or None).
+    """
+    start, stop = task["start"], task["stop"]
+    x = task["x"]
+    shared = {key: SharedMatrix(*task[key])
+              for key in ("data", "output", "normdata", "blank", "weights")
+              if task.get(key) is not None}
+    try:
+        # A copy, so that no fit keeps a view of the shared block.
+        y = shared["data"].array[start:stop].T.copy()
+        if "blank" in shared:
+            blank = shared["blank"].array[start:stop].T
+            y = y - interpolate.interp1d(task["blank_x"], blank,
+                                         kind="cubic", axis=0)(x)
+        if "output" in shared:
+            shared["output"].array[start:stop] = y.T
+        if "normdata" in shared:
+            shared["normdata"].array[start:stop] = (y/y.max(axis=0)).T
+        columns = task["columns"]
+        found = None
+        if task["peaks"] is not None:
+            found = pd.DataFrame(peakfinder.track(x, y, **task["peaks"]),
+                                 index=columns)
+        report = None
+        if task["fit"] is not None:
+            fitter = copy.copy(task["template"])
+            fitter.fits = []
+            fitter.data = pd.DataFrame(y, index=x, columns=columns)
+            if "weights" in shared:
+                fitter.weights = pd.DataFrame(
+                    shared["weights"].array[start:stop].T.copy(), index=x,
+                    columns=columns)
+            fitter.fit_all_columns(compact=True, **task["fit"])
+            report = fitter.report
+    finally:
+        for matrix in shared.values():
+            matrix.close()
+    return start, found, report
+
+
+def blocks(columns, jobs=1, block_size=None):
+    """The (start, stop) column ranges. By default there are four blocks
+    per job, so the workers stay busy when some blocks take longer."""
+    if block_size is None:
+        block_size = max(1, math.ceil(columns / (4 * jobs)))
+    return [(start, min(start + block_size, columns))
+            for start in range(0, columns, block_size)]
+
+
+def process(spectra, blank=None, normalize=False, peaks=None, fit=None,
+            jobs=1, block_size=None):
+    """Subtracts the blank, normalizes, tracks the peaks and fits every
+    column of spectra.data, in blocks of columns processed by jobs worker
+    processes.
+
+    spectra.data is replaced with the blank subtracted data, spectra.normdata
+    with the data divided by the maximum of each column and, for a
+    LaurdanFitter or MeroFitter, spectra.report with the merged report.
+
+    :param spectra: a Spectra with its data.
+    :param blank: a Spectra whose columns are subtracted from the columns
+                  at the same position, as Spectra.substract_blank.
+                  (Default value = None)
+    :param normalize: also set spectra.normdata. (Default value = False)
+    :param peaks: dict of arguments for peaks.track, or True for the
+                  defaults. (Default value = None, no peaks)
+    :param fit: dict of arguments for fit_all_columns, or True for the
+                defaults. The fits are kept compact in the workers and only
+                the report is returned. spectra.weights, if any, weight the
+                fits. (Default value = None, no fits)
+    :param jobs: number of worker processes. (Default value = 1)
+    :param block_size: number of columns per block. (Default value = None)
+    :returns: the peaks of every column as a DataFrame, or None.
+    """
+    if fit is not None and not hasattr(spectra, "fit_all_columns"):
+        raise ValueError("Only a LaurdanFitter or MeroFitter can be fitted")
+    if fit is True:
+        fit = {}
+    if fit is not None:
+        # The workers do not write files, the report is merged here.
+        fit = dict(fit, export=False, stream_report=False)
+    x = np.asarray(spectra.data.index, dtype=float)
+    columns = list(spectra.data.columns)
+    shared = {"data": SharedMatrix.from_array(
+        np.asarray(spectra.data, dtype=float).T)}
+    try:
+        if blank is not None:
+            shared["blank"] = SharedMatrix.from_array(
+                np.asarray(blank.data, dtype=float).T[:len(columns)])
+            shared["output"] = SharedMatrix(shared["data"].shape)
+        if normalize:
+            shared["normdata"] = SharedMatrix(shared["data"].shape)
+        if fit is not None and getattr(spectra, "weights", None) is not None:
+            shared["weights"] = SharedMatrix.from_array(
+                np.asarray(spectra.weights, dtype=float).T)
+        base = {key: (matrix.shape, matrix.name)
+                for key, matrix in shared.items()}
+        base.update(x=x, peaks={} if peaks is True else peaks,
+                    fit=fit, template=template(spectra) if fit is not None
+                    else None)
+        if blank is not None:
+            base["blank_x"] = np.asarray(blank.data.index, dtype=float)
+        tasks = [dict(base, start=start, stop=stop,
+                      columns=columns[start:stop])
+                 for start, stop in blocks(len(columns), jobs, block_size)]
+        if jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(process_block, tasks))
+        else:
+            results = [process_block(task) for task in tasks]
+
+        def frame(key):
+            return pd.DataFrame(shared[key].array.T.copy(),
+                                index=spectra.data.index,
+                                columns=spectra.data.columns)
+        if blank is not None:
+            spectra.data = frame("output")
+        if normalize:
+            spectra.normdata = frame("normdata")
+    finally:
+        for matrix in shared.values():
+            matrix.unlink()
+
+    results.sort(key=lambda result: result[0])
+    if fit is not None:
+        spectra.report = pd.concat([report for _, _, report in results])
+    if peaks is None:
+        return None
+    return pd.concat([found for _, found, _ in results])
@@ -0,0 +1,93 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+"""The spectranalyzer command: fits every experiment of a directory tree."""
+
+import argparse
+import os
+import sys
+import time
+import matplotlib
+from .batch import FITTERS, find_experiments, run_all
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="spectranalyzer",
+        description="Import, fit, report and export every experiment found "
+                    "in a directory tree.")
+    parser.add_argument("root", help="directory with the experiments")
+    parser.add_argument("-p", "--preset", default="Laurdan",
+                        choices=list(FITTERS),
+                        help="model preset to fit (default: %(default)s)")
+    parser.add_argument("-w", "--wavelength",
+                        help="read each directory as a series of "
+                             "'<value> <wavelength>.csv' files instead of "
+                             "reading each CSV file as a matrix of spectra")
+    parser.add_argument("--regex",
+                        help="regular expression to extract the value of "
+                             "each file of a series")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes "
+                             "(default: %(default)s)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="also fit the experiments whose report is "
+                             "newer than their inputs and was made with the "
+                             "same options")
+    parser.add_argument("--images", action="store_true",
+                        help="write the report images")
+    parser.add_argument("--starts", type=int, default=1,
+                        help="number of starts of each fit "
+                             "(default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def print_summary(results, elapsed, file=sys.stdout):
+    width = max([len("Experiment")] +
+                [len(os.path.join(experiment.directory, experiment.name))
+                 for experiment, *_ in results])
+    print(f"{'Experiment':<{width}}  {'Columns':>7}  {'Time (s)':>8}  Status",
+          file=file)
+    for experiment, status, columns, seconds in results:
+        path = os.path.join(experiment.directory, experiment.name)
+        print(f"{path:<{width}}  {columns:>7}  {seconds:>8.2f}  {status}",
+              file=file)
+    done = sum(1 for _, status, *_ in results if status == "done")
+    skipped = sum(1 for _, status, *_ in results if status == "skipped")
+    print(f"{done} done, {skipped} skipped, "
+          f"{len(results) - done - skipped} failed in {elapsed:.2f} s",
+          file=file)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    matplotlib.use("Agg")
+    experiments = find_experiments(args.root, args.wavelength)
+    if not experiments:
+        print(f"No experiments found in {args.root}", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    results = run_all(experiments, jobs=args.jobs, force=args.force,
+                      preset=args.preset, wavelength=args.wavelength,
+                      regex=args.regex, write_images=args.images,
+                      starts=args.starts)
+    print_summary(results, time.perf_counter() - start)
+    failed = [status for _, status, *_ in results
+              if status not in ("done", "skipped")]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
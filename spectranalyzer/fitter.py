@@ -15,23 +15,29 @@
 
 from .lnfitter import LNFitter
 from .lnfun import LNFun
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import os
 # from .fitter import Fitter
 from .spectra import Spectra
+from .report import ReportBuilder
+from .uncertainty import AreaQuantities
+from .lazy import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
+
+
+class Fitter(AreaQuantities):
+    AREAS = ("MonomerAgua", "DimerAgua")
 
-class Fitter():
     def __init__(self, name="Fitter"):
         self.fits = []
         self.name = name
     
     def load_data_from_json(self, data):
-        df = pd.DataFrame()
-        for item in data:
-            df = df.append(pd.Series(index=item['x'], data=item['y'], name=item['name']),)
-        self.df = df.transpose()
+        self.df = pd.concat([pd.Series(index=item['x'], data=item['y'],
+                                       name=item['name'])
+                             for item in data], axis=1)
 
     def load_file(self, filename, xlabel=None):
         self.name = filename.replace(".csv",
@@ -40,8 +46,12 @@ class Fitter():
         self.df = pd.read_csv(filename, index_col=0)
         self.sanitize_data()
         self.report = pd.DataFrame()
+        self.report_builder = ReportBuilder()
         self.xlabel = xlabel
 
+    def ratios(self, data):
+        return {"Equil": data["DimerAgua"]/data["MonomerAgua"]**2}
+
     def create_column_report(self, fitter, colname):
         x = np.asarray(self.data.index)
         areas = []
@@ -51,17 +61,12 @@ class Fitter():
             vms.append(fun.params["vm"].value)
             y0s.append(fun.params["y0"].value)
             areas.append(fun.calculate_area(x))
-        areas = np.asarray(areas)
-        totarea = areas.sum()
-        areas = areas / totarea * 100
-        equil = areas[1]/(areas[0])**2
-        data = np.append(areas, [vms, y0s])
-        data = np.append(data, [equil])
-        index = ["MonomerAgua", "DimerAgua",
-                 "VmMonomer", "VmDimer",
-                 "y0Monomer", "y0Dimer",
-                 "Equil"]
-        return pd.Series(data=data, index=index, name=colname)
+        derived = self.derived_quantities(None, areas)
+        return {"MonomerAgua": derived["MonomerAgua"],
+                "DimerAgua": derived["DimerAgua"],
+                "VmMonomer": vms[0], "VmDimer": vms[1],
+                "y0Monomer": y0s[0], "y0Dimer": y0s[1],
+                "Equil": derived["Equil"]}
 
     def fit_column(self, col, numln=False, fitter=None, plot=False):
         if not fitter and not numln:
@@ -76,18 +81,26 @@ class Fitter():
             plt.title(f"{self.name} {col}")
             plt.show()
 
-        ser = self.create_column_report(fitter, col)
-        self.report = pd.concat([self.report, ser], axis=1, sort=False)
+        self.report_builder.add_row(col,
+                                    self.create_column_report(fitter, col))
         self.fits.append(fitter)
 
     def fit_all_columns(self, numln=False, fitter=None, plot=False, export=False, 
-                        write_images=False):
-        self.report = pd.DataFrame()
-
-        for col in self.data.columns:
-            self.fit_column(col, numln=numln, fitter=fitter, plot=plot)
-
-        self.report = self.report.transpose()
+                        write_images=False, stream_report=False):
+        report_file = None
+        if stream_report:
+            try:
+                os.mkdir(self.name)
+            except FileExistsError:
+                pass
+            report_file = f"{self.name}{os.path.sep}{self.name}-report.csv"
+        self.report_builder = ReportBuilder(report_file)
+
+        with self.report_builder:
+            for col in self.data.columns:
+                self.fit_column(col, numln=numln, fitter=fitter, plot=plot)
+
+        self.report = self.report_builder.to_dataframe()
 
         if export:
             self.export_fits(write_images)
@@ -13,11 +13,24 @@
 # You should have received a copy of the GNU General Public License
 # along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
 
-from lmfit import minimize, Parameters
 import numpy as np
+import pandas as pd
+from .lazy import lazy_import
+from .lnmodel import bands, lognormal
+
+lmfit = lazy_import("lmfit")
+
 exp = np.exp
 log = np.log
 
+# Parameters of each band, in the order of lnmodel.bands.
+BAND_PARAMS = ('y0', 'vm', 'vmin', 'vmax')
+
+# Why fitln stopped with a spectrum: its chi-square converged, its damping
+# blew up, its step left the parameters unchanged (e.g. clipped at the
+# bounds) or it ran out of iterations.
+STOPS = ('converged', 'damping', 'step', 'max_iter')
+
 # La asimetría p y el número de onda límite a quedan definidas por vmin y vmax
 def getpa(vm, vmax, vmin):
     vmax, vmin = vmin, vmax
@@ -27,59 +40,186 @@ def getpa(vm, vmax, vmin):
 
 # Función lognormal teniendo todos los parámetros definidos
 def lognpa(x,y0,vm,p,a):
-    y = y0*exp(-log(2)/(log(p))**2*(log((a-10**7/x)/(a-10**7/vm)))**2) 
-    try:
-        y[np.isnan(y)] = 0
-    except TypeError:
-        if np.isnan(y):
-            y = 0
-#    y[np.isnan(y)] = 0
-    return y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = y0*exp(-log(2)/(log(p))**2*(log((a-10**7/x)/(a-10**7/vm)))**2)
+    return np.where(np.isnan(y), 0., y)[()]
 
 # Calcular primero p y a y luego llamar a la función lognormal
 def logn(x, y0, vm, vmax, vmin):
-    p, a = getpa(vm, vmax, vmin)
-    #print(p,a)
-    y = lognpa(x, y0, vm, p, a)
-    return y
+    return lognormal(x, y0, vm, vmin, vmax)
+
+
+def band_names(params):
+    """The band suffixes of params, whose names are y0<band>, vm<band>,
+    vmin<band> and vmax<band>, in the order of the y0s."""
+    return [name[2:] for name in params if name.startswith('y0')]
+
+
+def params_array(params, names=None):
+    """Array (bands, 4) with the values of params, and its bounds."""
+    if names is None:
+        names = band_names(params)
+    keys = [f"{pname}{band}" for band in names for pname in BAND_PARAMS]
+    values = np.array([params[key].value for key in keys], dtype=float)
+    lower = np.array([params[key].min for key in keys], dtype=float)
+    upper = np.array([params[key].max for key in keys], dtype=float)
+    shape = (len(names), len(BAND_PARAMS))
+    return values.reshape(shape), lower.reshape(shape), upper.reshape(shape)
 
 
 def residual(params, x, data = None):
-    y0a = params['y0a']
-    vma = params['vma']
-    y0b = params['y0b']
-    vmb = params['vmb']
-    vmaxa = params['vmaxa']
-    vmina = params['vmina']
-    vmaxb = params['vmaxb']
-    vminb = params['vminb']
-    
-    model = logn(x, y0a, vma, vmaxa, vmina) + logn(x, y0b, vmb, vmaxb, vminb)
-    
+    model = bands(x, params_array(params)[0])
+
     if data is None:
         return model
     else:
         return (data-model)
 
+
+def fitln(x, y, initial, lower=-np.inf, upper=np.inf, max_iter=200,
+          tolerance=1e-10):
+    """Fits the sum of N log-normal bands to every spectrum of a matrix at
+    once with a batched Levenberg-Marquardt. The residuals of all the
+    spectra are stacked, and since each spectrum only depends on its own
+    parameters the Jacobian is block diagonal: every iteration solves the
+    small system of each block, all of them in one call, with its own
+    damping. A spectrum converges when its chi-square no longer improves,
+    as if it was fitted alone. It also stops, without converging, when its
+    damping blows up or its step no longer changes the parameters. NaNs in
+    y are ignored and the parameters are kept within their bounds.
+
+    :param x: wavelengths (points,).
+    :param y: intensities (points, spectra).
+    :param initial: initial values (bands, 4), or (spectra, bands, 4) to
+                    start each spectrum from its own values.
+    :param lower: lower bounds, broadcast as initial. (Default value = -inf)
+    :param upper: upper bounds, broadcast as initial. (Default value = inf)
+    :param max_iter: maximum number of iterations. (Default value = 200)
+    :param tolerance: relative decrease of the chi-square below which a
+                      spectrum has converged. (Default value = 1e-10)
+    :returns: the fitted values (spectra, bands, 4), and a dict with the
+              chi-square of each spectrum, whether it converged, why it
+              stopped (see STOPS) and the number of iterations.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float).T
+    shape = (y.shape[0],) + np.shape(initial)[-2:]
+    valid = np.isfinite(y)
+    y = np.where(valid, y, 0.)
+    lower = np.broadcast_to(lower, shape).reshape(shape[0], -1)
+    upper = np.broadcast_to(upper, shape).reshape(shape[0], -1)
+    theta = np.clip(np.broadcast_to(initial, shape).reshape(shape[0], -1),
+                    lower, upper)
+
+    def evaluate(theta, rows):
+        model, jac = bands(x, theta.reshape((len(rows),) + shape[1:]),
+                           gradient=True)
+        r = np.where(valid[rows], y[rows] - model, 0.)
+        jac = np.where(valid[rows][..., np.newaxis], jac, 0.)
+        return r, jac, (r**2).sum(axis=-1)
+
+    rows = np.arange(shape[0])
+    r, jac, chisqr = evaluate(theta, rows)
+    damping = np.full(shape[0], 1.)
+    scale = np.full(theta.shape, 1e-300)
+    stop = np.full(shape[0], STOPS.index('max_iter'))
+    active = rows
+    iterations = 0
+    while active.size and iterations < max_iter:
+        iterations += 1
+        j = jac[active]
+        jtj = np.einsum('spk,spl->skl', j, j)
+        g = np.einsum('spk,sp->sk', j, r[active])
+        scale[active] = np.maximum(scale[active],
+                                   np.diagonal(jtj, axis1=1, axis2=2))
+        diag = scale[active]
+        system = jtj + damping[active, np.newaxis, np.newaxis] * \
+            (diag[..., np.newaxis]*np.eye(diag.shape[1]))
+        try:
+            step = np.linalg.solve(system, g[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.einsum('skl,sl->sk', np.linalg.pinv(system), g)
+        trial = np.clip(theta[active] + step, lower[active], upper[active])
+        tr, tjac, tchisqr = evaluate(trial, active)
+        better = tchisqr < chisqr[active]
+        # The first reason that applies, in the order of STOPS.
+        reasons = np.stack([better & (chisqr[active] - tchisqr <=
+                                      tolerance*chisqr[active]),
+                            damping[active] > 1e10,
+                            np.all(trial == theta[active], axis=1)])
+        done = reasons.any(axis=0)
+
+        accepted = active[better]
+        theta[accepted] = trial[better]
+        r[accepted] = tr[better]
+        jac[accepted] = tjac[better]
+        chisqr[accepted] = tchisqr[better]
+        damping[active] = np.where(better, damping[active]/10,
+                                   damping[active]*10)
+        stop[active[done]] = reasons[:, done].argmax(axis=0)
+        active = active[~done]
+    return theta.reshape(shape), {'chisqr': chisqr,
+                                  'converged': stop == 0,
+                                  'stop': np.array(STOPS)[stop],
+                                  'iterations': iterations}
+
+
+def default2ln():
+    params = lmfit.Parameters()
+    params.add('y0a', value=1., min=0.)
+    params.add('vma', value=10**7/580)
+    params.add('y0b', value=0.6, min=0.)
+    params.add('vmb', value=10**7/620)
+    params.add('vmina', value=10**7/560)
+    params.add('vmaxa', value=10**7/602)
+    params.add('vminb', value=10**7/602)
+    params.add('vmaxb', value=10**7/631)
+    return params
+
+
 def fit2ln(spectrum, params = None):
+    """Fits two log-normal bands, a and b, to a spectrum with lmfit.
+
+    :returns: the lmfit.MinimizerResult.
+    """
     x = np.asarray(spectrum.index)
     y = np.asarray(spectrum)
     if params is None:
-        params = Parameters()
-        params.add('y0a', value=1., min=0.)
-        params.add('vma', value=10**7/580)
-        params.add('y0b', value=0.6, min=0.)
-        params.add('vmb', value=10**7/620)
-        params.add('vmina', value=10**7/560)
-        params.add('vmaxa', value=10**7/602)
-        params.add('vminb', value=10**7/602)
-        params.add('vmaxb', value=10**7/631)
-    
-    out = minimize(residual, params, args=(x, y), nan_policy='raise')
-    #model = residual(params, x)
-    #res = residual(params, x, spectrum)
-    
-    return out
+        params = default2ln()
+
+    return lmfit.minimize(residual, params, args=(x, y), nan_policy='raise')
+
+
+def fitbands(spectrum, params = None, **kwargs):
+    """Fits log-normal bands to a spectrum or to every column of a matrix
+    of spectra at once (see fitln).
+
+    :param spectrum: pandas.Series, or pandas.DataFrame with a spectrum
+                     per column.
+    :param params: lmfit.Parameters with the initial values and bounds of
+                   y0, vm, vmin and vmax of each band, named y0a, vma, ...
+                   Any number of bands can be given. (Default value = None,
+                   the two bands of fit2ln)
+    :param kwargs: passed to fitln.
+    :returns: the fitted parameters, the chi-square and whether the fit
+              converged, as a pandas.Series for a spectrum or a
+              pandas.DataFrame with a row per column of a matrix.
+    """
+    if params is None:
+        params = default2ln()
+    names = band_names(params)
+    initial, lower, upper = params_array(params, names)
+    y = np.asarray(spectrum, dtype=float)
+    values, info = fitln(np.asarray(spectrum.index), y.reshape(len(y), -1),
+                         initial, lower, upper, **kwargs)
+    keys = [f"{pname}{band}" for band in names for pname in BAND_PARAMS]
+    result = pd.DataFrame(values.reshape(len(values), -1), columns=keys)
+    result["chisqr"] = info["chisqr"]
+    result["converged"] = info["converged"]
+    if isinstance(spectrum, pd.Series):
+        return result.iloc[0].rename(spectrum.name)
+    result.index = spectrum.columns
+    return result
 
 def hillfun(x, imax, Kd, n):
     return imax*x**n / (Kd**n + x**n)
@@ -94,8 +234,8 @@ def hillresidual(params, x, data):
 def fithill(data):
     x = np.asarray(data.index)
     y = np.asarray(data)
-    params = Parameters()
+    params = lmfit.Parameters()
     params.add('imax', value=10., min=0.)
     params.add('Kd', value=5., min=0.)
     params.add('n', value=1., min=0.)
-    return minimize(hillresidual, params, args=(x, y))
\ No newline at end of file
+    return lmfit.minimize(hillresidual, params, args=(x, y))
\ No newline at end of file
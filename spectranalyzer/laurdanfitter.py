@@ -13,24 +13,36 @@
 # You should have received a copy of the GNU General Public License
 # along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
 
-from .lnfitter import LNFitter
-from .lnfun import LNFun
+from .lnfitter import LNFitter, ColumnFits
+from .presets import get_preset
 #from .fitter import Fitter
 from .spectra import Spectra
-import matplotlib.pyplot as plt
+from .report import ReportBuilder
+from .uncertainty import AreaQuantities
 import numpy as np
 import pandas as pd
 import os
+from .lazy import lazy_import
 
+plt = lazy_import("matplotlib.pyplot")
+
+
+class LaurdanFitter(ColumnFits, AreaQuantities, Spectra):
+    AREAS = ("Relaxed", "NonRelaxed")
 
-class LaurdanFitter(Spectra):
     def __init__(self, title=None, ylabel=None, legend_title=None,
-                 label_fun=None, xlabel=None, fit_type="Bacalum"):
+                 label_fun=None, xlabel=None, fit_type="Bacalum",
+                 preset="Laurdan"):
         super().__init__(title, ylabel, legend_title, label_fun)
         self.name = title
         self.fits = []
         self.xlabel = xlabel
         self.fit_type = fit_type
+        self.preset = get_preset(preset)
+        self.report_builder = ReportBuilder()
+
+    def ratios(self, data):
+        return {"deltaS": (data["NonRelaxed"] - data["Relaxed"])/100}
 
     def create_column_report(self, fitter, colname):
         x = np.asarray(self.data.index)
@@ -41,55 +53,63 @@ class LaurdanFitter(Spectra):
             vms.append(fun.params["vm"].value)
             y0s.append(fun.params["y0"].value)
             areas.append(fun.calculate_area(x))
-        areas = np.asarray(areas)
-        totarea = areas.sum()
-        areas = areas / totarea * 100
-        deltas = (areas[1]-areas[0])/100
-        data = np.append(areas, [vms, y0s])
-        data = np.append(data, [deltas])
-        index = ["Relaxed", "NonRelaxed",
-                 "VmRelaxed", "VmNonRelaxed",
-                 "y0Relaxed", "y0Nonrelaxed",
-                 "deltaS"]
-        return pd.Series(data=data, index=index, name=colname)
-
-    def fit_column(self, col, plot=False):
-        fitter = LNFitter(self.data[col], fittype="Mero")
-
-        y0max = fitter.data.max().max()
-        lnrelaxed = LNFun()
-        lnrelaxed.name = "Relaxed"
-        lnnonrelaxed = LNFun()
-        lnnonrelaxed.name = "NonRelaxed"
-
-        lnrelaxed.set_param('y0', value=y0max/2., min=0., max=y0max)
-        lnrelaxed.set_param('vm', value=10**7/20000, min=10**7/21300)
-        lnnonrelaxed.set_param('y0', value=y0max/2., min=0., max=y0max)
-        lnnonrelaxed.set_param('vm', value=10**7/24000, max=10**7/22300,
-                               min=10**7/26000)
-
-        fitter.multiln.add_LN(lnrelaxed)
-        fitter.multiln.add_LN(lnnonrelaxed)
-
-        fitter.fit(plot=plot)
-        if plot:
-            plt.title(f"{self.name} {col}")
-            plt.show()
-
-        fitter.create_json_data()
-        ser = self.create_column_report(fitter, col)
-        self.report = pd.concat([self.report, ser], axis=1, sort=False)
-        self.fits.append(fitter)
-
-    def fit_all_columns(self, plot=False, export=False, write_images=False):
-        self.report = pd.DataFrame()
-
-        for col in self.data.columns:
-            self.fit_column(col, plot)
-
-        self.report = self.report.transpose()
-
-        self.create_json_data()
+        derived = self.derived_quantities(None, areas)
+        return {"Relaxed": derived["Relaxed"],
+                "NonRelaxed": derived["NonRelaxed"],
+                "VmRelaxed": vms[0], "VmNonRelaxed": vms[1],
+                "y0Relaxed": y0s[0], "y0Nonrelaxed": y0s[1],
+                "deltaS": derived["deltaS"]}
+
+    def create_fitter(self, col, vary=True):
+        fitter = LNFitter.from_preset(self.data[col], self.preset, vary=vary)
+        if self.weights is not None:
+            fitter.weights = np.asarray(self.weights[col], dtype=float)
+        return fitter
+
+    def fit_column(self, col, plot=False, fitter=None, compact=False,
+                   **kwargs):
+        """Fits a column. kwargs are passed to LNFitter.fit. A fitter that
+        was already fitted (see create_fitters) is only reported.
+
+        :param compact: keep only a CompactFit of the fit in self.fits, its
+                        jsondata is then built when it is used.
+                        (Default value = False)
+        """
+        if fitter is None:
+            fitter = self.create_fitter(col)
+        self.add_fit(col, fitter, plot, compact, json=True, **kwargs)
+
+    def fit_all_columns(self, plot=False, export=False, write_images=False,
+                        stream_report=False, vary=True, compact=False,
+                        **kwargs):
+        """Fits every column. kwargs are passed to LNFitter.fit.
+
+        :param vary: if False, the fixable parameters of the preset do not
+                     vary. When only the amplitudes are left, the columns
+                     are fitted together with fit_linear. (Default value =
+                     True)
+        :param compact: keep only a CompactFit of each fit, so the memory
+                        used does not grow with the curves and lmfit objects
+                        of every column. jsondata is then not built.
+                        (Default value = False)
+        """
+        report_file = None
+        if stream_report:
+            try:
+                os.mkdir(self.name)
+            except FileExistsError:
+                pass
+            report_file = f"{self.name}{os.path.sep}{self.name}-report.csv"
+        self.report_builder = ReportBuilder(report_file)
+
+        with self.report_builder:
+            for col, fitter in self.create_fitters(vary=vary, **kwargs):
+                self.fit_column(col, plot, fitter, compact, **kwargs)
+
+        self.report = self.report_builder.to_dataframe()
+
+        if not compact:
+            self.create_json_data()
 
         if export:
             self.export_fits(write_images)
@@ -107,6 +127,7 @@ class LaurdanFitter(Spectra):
             pass
 
         for fit in self.fits:
+            fit = fit.restore()
             fit.multiln.create_dataframe(np.asarray(self.data.index))
             data = pd.concat([fit.multiln.df, fit.data], axis=1)
             data.to_csv(f"{self.name}{os.path.sep}{fit.data.name}.csv")
@@ -0,0 +1,48 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Deferred imports of the heavy dependencies (matplotlib.pyplot, scipy and
+lmfit), so that importing the package only costs numpy and pandas.
+
+    plt = lazy_import("matplotlib.pyplot")
+
+returns a stand-in that imports the module the first time one of its
+attributes is used. Names must be used through it (plt.plot,
+lmfit.Parameters), since "from module import name" imports right away.
+"""
+
+import importlib
+
+
+class LazyModule():
+    """Stands for the module name until it is needed."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """Returns a LazyModule for the module name."""
+    return LazyModule(name)
@@ -13,48 +13,63 @@
 # You should have received a copy of the GNU General Public License
 # along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
 
-from lmfit import minimize, Parameters
+from copy import deepcopy
 import numpy as np
-import matplotlib.pyplot as plt
 from .lnfun import LNFun
 from .multiln import MultiLN
+from .presets import get_preset
+from .paramlist import DTYPE
+from .noise import noise_weights
+from .lazy import lazy_import
+
+lmfit = lazy_import("lmfit")
+optimize = lazy_import("scipy.optimize")
+plt = lazy_import("matplotlib.pyplot")
+
+# Columns fitted together by the fitters of whole experiments, see
+# ColumnFits.create_fitters.
+BATCH = 256
+
+# Fit statistics kept by CompactFit.
+STATS = ('chisqr', 'redchi', 'ndata', 'nfree', 'nvarys', 'nfev', 'success',
+         'aic', 'bic', 'method', 'message')
 
 
 class LNFitter():
     def __init__(self, data, numln=0, fittype=None):
-        self.params = Parameters()
+        self.params = lmfit.Parameters()
         self.paramkeys = []
+        self.layout = None
         self.multiln = MultiLN()
         self.data = data
         self.jsondata = None
         self.fittype = fittype
-        for i in range(numln):
-            fun = LNFun()
-
-            y0max = self.data.max()
-            # /numln, vary=True, min=self.data.max()/4, max=self.data.max())
-            # vm = 0 # self.data.index.min() + (self.data.index.max()
-            # - self.data.index.min()) / (numln+1) * (i+1)
-            if i == 0:
-                fun.set_param('y0', value=y0max/2., min=0., max=y0max)
-                fun.set_param('vm', value=416)  # , min=10**7/21300)
-                vmin, vmax = fun.get_vmax_vmin(416)
-                fun.set_param('vmin', value=vmin)
-                fun.set_param('vmax', value=vmax)
-            else:
-                fun.set_param('y0', value=y0max/2., min=0., max=y0max)
-                fun.set_param('vm', value=500)  # , max=10**7/22300,
-                vmin, vmax = fun.get_vmax_vmin(500)
-                fun.set_param('vmin', value=vmin)
-                fun.set_param('vmax', value=vmax)
-            # fun.set_param("vm", vm, vary=True)
-            # fun.set_param("vmin", vm - 10)
-            # fun.set_param("vmax", vm + 20)
-            fun.name = f"Component-{i}"
-            self.multiln.add_LN(fun)
+        self.preset = None
+        self.out = None
+        self.weights = None
+        self.residual_weights = None
+        self.start_chisqrs = None
+        self.window = None
+        self.chisqr_spread = None
+        if numln:
+            get_preset(f"Generic-{numln}").setup(self)
+
+    @classmethod
+    def from_preset(cls, data, preset, vary=True):
+        """Creates a fitter for data with the components of a preset.
+
+        :param data: the spectrum to fit (pandas.Series).
+        :param preset: a ModelPreset or the name of a registered one.
+        :param vary: if False, the fixable parameters of the preset do not
+                     vary. (Default value = True)
+        """
+        if isinstance(preset, str):
+            preset = get_preset(preset)
+        fitter = cls(data, fittype=preset.fittype)
+        return preset.setup(fitter, vary=vary)
 
     def extract_params_by_name(self, name):
-        params = Parameters()
+        params = lmfit.Parameters()
         for param in self.params.valuesdict():
             if f"{name}y0" == param:
                 pname = 'y0'
@@ -71,53 +86,505 @@ class LNFitter():
                        max=self.params[param].max)
         return params
 
+    def create_parameters(self):
+        """Flattens the parameters of every component into self.params and
+        records where each one goes back to in the layout."""
+        self.params = lmfit.Parameters()
+        self.paramkeys = []
+        self.layout = []
+        for lnfun in self.multiln.lnfuns:
+            name = lnfun.name.replace('-', '')
+            self.paramkeys.append(name)
+            for pname, param in lnfun.params.items():
+                self.params.add(f"{name}{pname}", value=param.value,
+                                min=param.min, max=param.max,
+                                vary=param.vary)
+                self.layout.append((lnfun, pname, f"{name}{pname}"))
+
     def residual(self, params, x, data):
         self.params = params
-        for key in self.paramkeys:
-            fun = self.multiln.find_by_name(key)
-            params = self.extract_params_by_name(fun.name.replace("-", ""))
-            fun.params = params
+        for fun, pname, fullname in self.layout:
+            fun.params[pname].value = params[fullname].value
 
         model = self.multiln.evaluate(x)
 
-        return (data-model)
+        residual = data - model
+        if self.residual_weights is not None:
+            # In place, the weights are cropped once per fit.
+            residual *= self.residual_weights
+        return residual
 
-    def fit(self, plot=False):
-        for lnfun in self.multiln.lnfuns:
-            params = lnfun.params.valuesdict()
-            name = lnfun.name.replace('-', '')
-            self.paramkeys.append(name)
-            for param in params:
-                self.params.add(f"{name}{param}", value=params[param],
-                                min=lnfun.params[param].min,
-                                max=lnfun.params[param].max,
-                                vary=lnfun.params[param].vary)
+    def fit(self, plot=False, starts=1, tolerance=1e-3, spread=0.1,
+            seed=None, crop=None, margin=10., linear=True, project=False,
+            weights=None):
+        """Fits the components to the data.
+
+        :param plot: plot the result. (Default value = False)
+        :param starts: number of starts. The first one uses the initial
+                       values, the others perturbed ones. (Default value = 1)
+        :param tolerance: relative chi-square tolerance. The starts stop as
+                          soon as one reaches the best chi-square so far
+                          within it. (Default value = 1e-3)
+        :param spread: relative perturbation of the parameters without both
+                       bounds, the rest are drawn uniformly within their
+                       bounds. (Default value = 0.1)
+        :param seed: seed for the perturbations. (Default value = None)
+        :param crop: if given, only the window where the data is above this
+                     fraction of its maximum is fitted. The window is kept
+                     in self.window. (Default value = None)
+        :param margin: the window is widened by margin nm on both sides.
+                       (Default value = 10.)
+        :param linear: if only amplitudes vary (see is_linear), solve the
+                       fit as a bounded linear least squares problem
+                       instead, and ignore starts. (Default value = True)
+        :param project: fit the first start by variable projection, see
+                        fit_projected. (Default value = False)
+        :param weights: the weight of each point of the data, which
+                        multiplies the residual, e.g. a column of
+                        Spectra.weights. Kept in self.weights for the next
+                        fits. (Default value = None)
+        """
+        if self.layout is None:
+            self.create_parameters()
 
+        if weights is not None:
+            self.weights = np.asarray(weights, dtype=float)
         x = np.asarray(self.data.index)
         y = np.asarray(self.data)
-        self.out = minimize(self.residual, self.params, args=(x, y),
-                            nan_policy='omit')
+        w = self.weights
+        if crop is not None:
+            self.window = self.crop_window(crop, margin)
+            inside = (x >= self.window[0]) & (x <= self.window[1])
+            x, y = x[inside], y[inside]
+            w = None if w is None else w[inside]
+        self.residual_weights = w
+        if linear and self.is_linear():
+            fit_linear([self], x, y[:, np.newaxis],
+                       None if w is None else w[:, np.newaxis])
+            if plot:
+                self.plot()
+            return
+        initial = deepcopy(self.params) if starts > 1 else None
+        if project:
+            self.out = self.fit_projected(x, y)
+        else:
+            self.out = lmfit.minimize(self.residual, self.params,
+                                      args=(x, y), nan_policy='omit')
+        if starts > 1:
+            self.fit_multistart(initial, x, y, starts, tolerance, spread,
+                                seed)
         if plot:
-            self.multiln.plot(x)
-            self.data.plot(style=':', linewidth=3, label="Data")
-            plt.legend()
+            self.plot()
+
+    def set_noise(self, noise="poisson", sd=None, floor=None):
+        """Sets self.weights from a noise model of the data, see
+        noise_weights. They are used by the next fits.
+
+        :param noise: "poisson", "replicates" or an array with the standard
+                      deviation of each point. (Default value = "poisson")
+        :param sd: the standard deviation of the replicates.
+                   (Default value = None)
+        :param floor: see noise_weights. (Default value = None)
+        """
+        self.weights = noise_weights(np.asarray(self.data, dtype=float),
+                                     noise, sd, floor)
+
+    def is_linear(self):
+        """True if only amplitudes (y0) vary, so the model is linear in the
+        free parameters."""
+        if self.layout is None:
+            self.create_parameters()
+        return any(self.params[name].vary for name in self.params) and \
+            all(pname == 'y0' or not self.params[fullname].vary
+                for _, pname, fullname in self.layout)
+
+    def shape_key(self):
+        """The values of the fixed parameters. Fitters with the same key
+        and grid have the same basis in fit_linear."""
+        return tuple((name, self.params[name].value) for name in self.params
+                     if not self.params[name].vary)
+
+    def linear_basis(self, x, names=None):
+        """For a linear model, returns the components at unit amplitude
+        (points, free amplitudes), the names of those amplitudes and the sum
+        of the components whose amplitude is fixed.
+
+        :param names: the free amplitudes. (Default value = the amplitudes
+                      that vary)
+        """
+        if names is None:
+            names = [fullname for _, pname, fullname in self.layout
+                     if pname == 'y0' and self.params[fullname].vary]
+        columns = {}
+        fixed = np.zeros(len(x))
+        for fun, pname, fullname in self.layout:
+            fun.params[pname].value = self.params[fullname].value
+        for fun, pname, fullname in self.layout:
+            if pname != 'y0':
+                continue
+            shape = np.asarray(fun.basis(x), dtype=float)
+            if fullname in names:
+                columns[fullname] = shape
+            else:
+                fixed = fixed + shape*self.params[fullname].value
+        return np.column_stack([columns[name] for name in names]), \
+            list(names), fixed
+
+    def projected_residual(self, params, x, y, names, lower, upper):
+        """Residual for the shape parameters in params, with the amplitudes
+        in names solved by bounded linear least squares and set in params.
+        """
+        self.params = params
+        basis, _, fixed = self.linear_basis(x, names)
+        target = y - fixed
+        if self.residual_weights is not None:
+            basis = basis*self.residual_weights[:, np.newaxis]
+            target = target*self.residual_weights
+        amplitudes = solve_amplitudes(basis, target[:, np.newaxis],
+                                      lower, upper)[:, 0]
+        for name, value in zip(names, amplitudes):
+            params[name].value = float(value)
+        return target - basis @ amplitudes
+
+    def fit_projected(self, x, y):
+        """Variable projection: lmfit only varies the shape parameters,
+        the amplitudes are solved for at each step (see projected_residual).
+        The solution is then refined with all the parameters, which also
+        gives their covariance. Without varying amplitudes it is a plain
+        fit."""
+        names = [fullname for _, pname, fullname in self.layout
+                 if pname == 'y0' and self.params[fullname].vary]
+        if not names:
+            return lmfit.minimize(self.residual, self.params, args=(x, y),
+                                  nan_policy='omit')
+        shapes = deepcopy(self.params)
+        for name in names:
+            shapes[name].vary = False
+        lower = np.array([[shapes[name].min] for name in names], dtype=float)
+        upper = np.array([[shapes[name].max] for name in names], dtype=float)
+        args = (x, y, names, lower, upper)
+        out = lmfit.minimize(self.projected_residual, shapes, args=args,
+                             nan_policy='omit')
+        params = out.params
+        self.projected_residual(params, *args)
+        for name in names:
+            params[name].vary = True
+        return lmfit.minimize(self.residual, params, args=(x, y),
+                              nan_policy='omit')
+
+    def set_linear_result(self, x, y, names, amplitudes, basis):
+        """Sets the amplitudes found by fit_linear and the fit result, with
+        the covariance of the linear problem scaled by the reduced
+        chi-square, as lmfit does. basis is weighted as the residual."""
+        for name, value in zip(names, amplitudes):
+            self.params[name].value = float(value)
+        residual = self.residual(self.params, x, y)
+        valid = np.isfinite(residual)
+        chisqr = float(np.sum(residual[valid]**2))
+        ndata = int(valid.sum())
+        nfree = ndata - len(names)
+        redchi = chisqr/nfree if nfree > 0 else np.inf
+        b = basis[valid]
+        covar = np.linalg.pinv(b.T @ b)*redchi
+        for name, variance in zip(names, np.diagonal(covar)):
+            self.params[name].stderr = float(np.sqrt(variance))
+        self.out = lmfit.minimizer.MinimizerResult(
+            params=deepcopy(self.params), var_names=list(names),
+            covar=covar, init_vals=list(amplitudes), chisqr=chisqr,
+            redchi=redchi, residual=residual, ndata=ndata,
+            nvarys=len(names), nfree=nfree, nfev=1, success=True,
+            errorbars=True, method='bvls',
+            message='Linear least squares.')
+
+    def crop_window(self, threshold, margin=10.):
+        """Returns the wavelength range where the data is above threshold
+        times its maximum, widened by margin on both sides."""
+        x = np.asarray(self.data.index, dtype=float)
+        y = np.asarray(self.data, dtype=float)
+        above = x[y >= threshold*np.nanmax(y)]
+        return (max(above.min() - margin, x.min()),
+                min(above.max() + margin, x.max()))
+
+    def perturb(self, params, rng, spread=0.1):
+        """Returns a copy of params with the varying values perturbed."""
+        params = deepcopy(params)
+        names = [name for name in params if params[name].vary]
+        values = np.array([params[name].value for name in names])
+        mins = np.array([params[name].min for name in names])
+        maxs = np.array([params[name].max for name in names])
+        bounded = np.isfinite(mins) & np.isfinite(maxs)
+        values = np.where(bounded,
+                          rng.uniform(np.where(bounded, mins, 0.),
+                                      np.where(bounded, maxs, 1.)),
+                          values * (1 + rng.uniform(-spread, spread,
+                                                    values.size)))
+        values = np.clip(values, mins, maxs)
+        for name, value in zip(names, values):
+            params[name].value = value
+        return params
+
+    def fit_multistart(self, initial, x, y, starts, tolerance=1e-3,
+                       spread=0.1, seed=None):
+        """Runs up to starts-1 more fits from perturbed initial values and
+        keeps the best one. Sets self.start_chisqrs to the chi-square of
+        every start that was run and self.chisqr_spread to their range."""
+        rng = np.random.default_rng(seed)
+        best = self.out
+        chisqrs = [best.chisqr]
+        for _ in range(1, starts):
+            out = lmfit.minimize(self.residual,
+                                 self.perturb(initial, rng, spread),
+                                 args=(x, y), nan_policy='omit')
+            chisqrs.append(out.chisqr)
+            if out.chisqr < best.chisqr * (1 - tolerance):
+                best = out
+            elif out.chisqr <= best.chisqr * (1 + tolerance):
+                break
+        self.out = best
+        # Leave the components with the values of the best fit.
+        self.residual(best.params, x, y)
+        self.start_chisqrs = np.asarray(chisqrs)
+        self.chisqr_spread = np.ptp(self.start_chisqrs)
+
+    def plot(self):
+        self.multiln.plot(np.asarray(self.data.index))
+        self.data.plot(style=':', linewidth=3, label="Data")
+        plt.legend()
+
+    def compact(self):
+        """Returns a CompactFit with the result of the fit."""
+        return CompactFit(self)
+
+    def restore(self):
+        """The fitter itself, see CompactFit.restore."""
+        return self
 
     def create_json_data(self):
-        curve = {
-            'x': self.data.index.values.tolist(),
+        # Every curve shares the same x, it is converted to a list only once.
+        x = self.data.index.values.tolist()
+        jsondata = [{
+            'x': x,
             'y': self.data.values.tolist(),
             'name': str(self.data.name)
-        }
-
-        jsondata = [curve,]
-        for col in self.multiln.df:
-            x = self.multiln.df[col].index.values.tolist()
-            y = self.multiln.df[col].values.tolist()
-            name = str(self.multiln.df[col].name)
-            curve = {
-                'x': x,
+        }]
+        xdf = self.multiln.df.index.values.tolist()
+        for col, y in zip(self.multiln.df.columns,
+                          self.multiln.df.values.T.tolist()):
+            jsondata.append({
+                'x': xdf,
                 'y': y,
-                'name': str(name)
-            } 
-            jsondata.append(curve)
+                'name': str(col)
+            })
         self.jsondata = jsondata
+
+
+class ColumnFits():
+    """Mixin for the Spectra that fit every column with its own LNFitter,
+    made by create_fitter(col, *args, vary=vary). fit_column adds the fit
+    and its report row."""
+
+    def create_fitters(self, *args, vary=True, crop=None, linear=True,
+                       **kwargs):
+        """Yields (column, fitter) for every column. The fitters are created
+        BATCH columns at a time. The columns of a batch whose model is
+        linear (see LNFitter.is_linear) are fitted together with fit_linear,
+        grouped by their fixed parameters. The other columns, and cropped
+        columns, which have their own window, are left to fit_column.
+
+        :param args: passed to create_fitter.
+        """
+        x = np.asarray(self.data.index, dtype=float)
+        columns = list(self.data.columns)
+        for start in range(0, len(columns), BATCH):
+            batch = columns[start:start + BATCH]
+            fitters = [self.create_fitter(col, *args, vary=vary)
+                       for col in batch]
+            linears = [fitter for fitter in fitters if fitter.is_linear()] \
+                if linear and crop is None else []
+            if linears:
+                fit_linear(linears, x,
+                           np.column_stack([np.asarray(fitter.data,
+                                                       dtype=float)
+                                            for fitter in linears]),
+                           None if self.weights is None else
+                           np.column_stack([fitter.weights
+                                            for fitter in linears]))
+            fitters.reverse()
+            for col in batch:
+                yield col, fitters.pop()
+
+    def add_fit(self, col, fitter, plot=False, compact=False, json=False,
+                **kwargs):
+        """Fits a column with fitter, unless it was already fitted (see
+        create_fitters), and adds its report row and the fit to self.fits.
+        kwargs are passed to LNFitter.fit.
+
+        :param compact: keep only a CompactFit of the fit.
+                        (Default value = False)
+        :param json: also build the jsondata of the fitter, unless compact.
+                     (Default value = False)
+        """
+        if fitter.out is None:
+            fitter.fit(plot=plot, **kwargs)
+        elif plot:
+            fitter.plot()
+        if plot:
+            plt.title(f"{self.name} {col}")
+            plt.show()
+
+        if json and not compact:
+            fitter.create_json_data()
+        row = self.create_column_report(fitter, col)
+        if fitter.window is not None:
+            row["WindowMin"], row["WindowMax"] = fitter.window
+        self.report_builder.add_row(col, row)
+        self.fits.append(fitter.compact() if compact else fitter)
+
+
+class CompactFit():
+    """The result of an LNFitter without its components, curves and lmfit
+    objects: the data, the parameters (values, stderrs, bounds and vary
+    flags, see paramlist.DTYPE), the covariance and the statistics of the
+    fit. The lmfit result and the components are rebuilt when they are
+    used, from the preset of the fitter.
+
+    :param fitter: a fitted LNFitter created from a preset.
+    """
+    __slots__ = ('data', 'preset', 'fittype', 'window', 'names', 'params',
+                 'var_names', 'covar', 'stats')
+
+    def __init__(self, fitter):
+        if fitter.preset is None:
+            raise ValueError("Only fitters created from a preset can be "
+                             "compacted")
+        out = fitter.out
+        params = fitter.params if out is None else out.params
+        self.data = fitter.data
+        self.preset = fitter.preset
+        self.fittype = fitter.fittype
+        self.window = fitter.window
+        self.names = list(params)
+        self.params = np.array(
+            [(param.value,
+              np.nan if param.stderr is None else param.stderr,
+              param.min, param.max, param.vary)
+             for param in params.values()], dtype=DTYPE)
+        self.var_names = None if out is None else list(out.var_names)
+        self.covar = None if out is None else out.covar
+        self.stats = {} if out is None else \
+            {name: getattr(out, name) for name in STATS if hasattr(out, name)}
+
+    def parameters(self):
+        """The fitted parameters as lmfit Parameters."""
+        params = lmfit.Parameters()
+        params.add_many(*[(name, float(row['value']), bool(row['vary']),
+                           float(row['min']), float(row['max']))
+                          for name, row in zip(self.names, self.params)])
+        for name, row in zip(self.names, self.params):
+            if np.isfinite(row['stderr']):
+                params[name].stderr = float(row['stderr'])
+        return params
+
+    @property
+    def out(self):
+        if self.var_names is None:
+            return None
+        return lmfit.minimizer.MinimizerResult(
+            params=self.parameters(), var_names=list(self.var_names),
+            covar=self.covar, **self.stats)
+
+    @property
+    def multiln(self):
+        return self.restore().multiln
+
+    @property
+    def jsondata(self):
+        fitter = self.restore()
+        fitter.create_json_data()
+        return fitter.jsondata
+
+    def plot(self):
+        self.restore().plot()
+
+    def compact(self):
+        return self
+
+    def restore(self):
+        """Rebuilds the fitter, with its components set to the fitted
+        parameters."""
+        fitter = LNFitter(self.data, fittype=self.fittype)
+        self.preset.setup(fitter)
+        fitter.residual(self.parameters(), np.asarray(self.data.index),
+                        np.asarray(self.data))
+        fitter.out = self.out
+        fitter.window = self.window
+        return fitter
+
+
+def solve_amplitudes(basis, y, lower, upper):
+    """Bounded linear least squares y ~ basis @ a for many columns at once.
+    Every column is solved with a single lstsq call. Only the columns whose
+    solution is out of bounds, or that have NaNs, are solved again one by
+    one with bounded variable least squares.
+
+    :param basis: (points, amplitudes).
+    :param y: (points, columns).
+    :param lower: (amplitudes, columns) lower bounds.
+    :param upper: (amplitudes, columns) upper bounds.
+    :returns: the amplitudes (amplitudes, columns).
+    """
+    finite = np.isfinite(y)
+    complete = finite.all(axis=0)
+    amplitudes = np.empty((basis.shape[1], y.shape[1]))
+    amplitudes[:, complete] = np.linalg.lstsq(basis, y[:, complete],
+                                              rcond=None)[0]
+    redo = ~complete | np.any((amplitudes < lower) | (amplitudes > upper),
+                              axis=0)
+    for j in np.flatnonzero(redo):
+        rows = finite[:, j]
+        amplitudes[:, j] = optimize.lsq_linear(
+            basis[rows], y[rows, j], bounds=(lower[:, j], upper[:, j]),
+            method='bvls').x
+    return amplitudes
+
+
+def fit_linear(fitters, x, y, weights=None):
+    """Fits fitters whose models are linear (see LNFitter.is_linear) on the
+    grid x, column j of y being the data of fitters[j]. The fitters with the
+    same fixed parameters share their basis, which is computed once, and
+    the columns with uniform weights are solved together.
+
+    :param fitters: list of LNFitter.
+    :param x: wavelengths (points,).
+    :param y: data (points, fitters).
+    :param weights: weights of the residuals (points, fitters).
+                    (Default value = None)
+    """
+    groups = {}
+    for j, fitter in enumerate(fitters):
+        groups.setdefault(fitter.shape_key(), []).append(j)
+    for columns in groups.values():
+        basis, names, fixed = fitters[columns[0]].linear_basis(x)
+        lower = np.array([[fitters[j].params[name].min for j in columns]
+                          for name in names], dtype=float)
+        upper = np.array([[fitters[j].params[name].max for j in columns]
+                          for name in names], dtype=float)
+        target = y[:, columns] - fixed[:, np.newaxis]
+        # A weight that is the same for every point does not change the
+        # solution, only the covariance.
+        uniform = np.ones(len(columns), dtype=bool) if weights is None \
+            else np.ptp(weights[:, columns], axis=0) == 0
+        amplitudes = np.empty((len(names), len(columns)))
+        amplitudes[:, uniform] = solve_amplitudes(
+            basis, target[:, uniform], lower[:, uniform], upper[:, uniform])
+        for k in np.flatnonzero(~uniform):
+            w = weights[:, columns[k], np.newaxis]
+            amplitudes[:, k] = solve_amplitudes(
+                basis*w, target[:, k:k + 1]*w, lower[:, k:k + 1],
+                upper[:, k:k + 1])[:, 0]
+        for k, j in enumerate(columns):
+            w = None if weights is None else weights[:, j]
+            fitters[j].residual_weights = w
+            fitters[j].set_linear_result(
+                x, y[:, j], names, amplitudes[:, k],
+                basis if w is None else basis*w[:, np.newaxis])
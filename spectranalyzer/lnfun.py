@@ -13,21 +13,26 @@
 # You should have received a copy of the GNU General Public License
 # along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
 
-from lmfit import Parameters
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.integrate import quad
+from .lazy import lazy_import
+
+lmfit = lazy_import("lmfit")
+plt = lazy_import("matplotlib.pyplot")
+integrate = lazy_import("scipy.integrate")
 
 exp = np.exp
 log = np.log
 
-
 class LNFun():
     def __init__(self, params=None):
         self.p = None
         self.a = None
+        self.key = None
+        self.constants = None
+        self.buffer = None
+        self.grid = None
         if params is None:
-            self.params = Parameters()
+            self.params = lmfit.Parameters()
         else:
             self.params = params
 
@@ -76,25 +81,67 @@ class LNFun():
         a = 10**7/vm + ((10**7/vmax-10**7/vmin)*p)/(p**2-1)
         return p, a
 
+    def shape_constants(self):
+        """p, a, -log(2)/log(p)**2 and a-10**7/vm, recomputed only when
+        vm, vmin, vmax, p or a change."""
+        key = (self.p, self.a) + tuple(self.params[name].value
+                                       for name in ('vm', 'vmin', 'vmax')
+                                       if name in self.params)
+        if key != self.key:
+            if (not self.p and not self.a):
+                p, a = self.getpa()
+            else:
+                p, a = self.p, self.a
+            vm = self.params['vm'].value
+            self.constants = (p, a, -log(2)/(log(p))**2, a-10**7/vm)
+            self.key = key
+        return self.constants
+
     def lognpa(self, x, p, a):
         y0 = self.params['y0'].value
         vm = self.params['vm'].value
-        y = y0*exp(-log(2)/(log(p))**2*(log((a-10**7/x)/(a-10**7/vm)))**2)
-        if type(y) is np.ndarray:
-            y[np.isnan(y)] = 0
-        elif np.isnan(y):
-            y = 0
+        return self.shape(x, y0, a, -log(2)/(log(p))**2, a-10**7/vm)
+
+    def wavenumbers(self, x):
+        """10**7/x, reusing the last result while x holds the same
+        values."""
+        if self.grid is None or not np.array_equal(self.grid[0], x):
+            self.grid = (np.array(x, dtype=float), 10**7/x)
+        return self.grid[1]
+
+    def shape(self, x, y0, a, c, d):
+        """y0*exp(c*log((a-10**7/x)/d)**2), with NaNs set to 0. For arrays,
+        the intermediate steps are computed in a buffer kept between calls,
+        and only the result is a new array."""
+        if np.ndim(x) == 0:
+            y = y0*exp(c*(log((a-10**7/x)/d))**2)
+            return 0 if np.isnan(y) else y
+        k = self.wavenumbers(x)
+        if self.buffer is None or self.buffer.shape != k.shape:
+            self.buffer = np.empty_like(k)
+        buffer = self.buffer
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.subtract(a, k, out=buffer)
+            np.divide(buffer, d, out=buffer)
+            np.log(buffer, out=buffer)
+            np.square(buffer, out=buffer)
+            np.multiply(buffer, c, out=buffer)
+            np.exp(buffer, out=buffer)
+        y = np.multiply(buffer, y0)
+        np.copyto(y, 0., where=np.isnan(y))
         return y
 
     def evaluate(self, x):
-        if (not self.p and not self.a):
-            p, a = self.getpa()
-        else:
-            p, a = self.p, self.a
-        y = self.lognpa(x, p, a)
+        p, a, c, d = self.shape_constants()
+        y = self.shape(x, self.params['y0'].value, a, c, d)
         self.y = y
         return y
 
+    def basis(self, x):
+        """The component with y0 = 1."""
+        p, a, c, d = self.shape_constants()
+        return self.shape(x, 1., a, c, d)
+
     def plot(self, x):
         y = self.evaluate(x)
         plt.plot(x, y)
@@ -105,5 +152,5 @@ class LNFun():
         plt.plot(x, y)
 
     def calculate_area(self, x):
-        area = quad(self.evaluate, x.min(), x.max(), args=())[0]
+        area = integrate.quad(self.evaluate, x.min(), x.max(), args=())[0]
         return area
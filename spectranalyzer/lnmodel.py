@@ -0,0 +1,143 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Vectorized log-normal bands with analytic derivatives.
+
+The bands are the same as LNFun's: x, vm, vmin and vmax are wavelengths
+(nm) and every parameter broadcasts against x, so many bands, spectra or
+parameter samples can be evaluated at once.
+"""
+
+from functools import lru_cache
+import numpy as np
+
+NM = 10**7
+LN2 = np.log(2)
+
+
+def band_limits(vm):
+    """Wavenumber limits of a band from the wavenumber of its maximum, as
+    in LNFun.get_vmax_vmin. Also returns their derivatives."""
+    low = vm <= 22300
+    lo = np.where(low, -958.4 + .966*vm, 1150.7 + .877*vm)
+    hi = np.where(low, 1688.8 + .986*vm, -99.3 + 1.058*vm)
+    return lo, hi, np.where(low, .966, .877), np.where(low, .986, 1.058)
+
+
+def wavenumbers(vm, vmin=None, vmax=None):
+    """Converts the band parameters to wavenumbers: the maximum v and the
+    limits lo and hi. Without vmin and vmax, the limits are derived from
+    vm."""
+    v = NM/np.asarray(vm, dtype=float)
+    if vmin is None:
+        lo, hi = band_limits(v)[:2]
+    else:
+        lo = NM/np.asarray(vmax, dtype=float)
+        hi = NM/np.asarray(vmin, dtype=float)
+    return v, lo, hi
+
+
+def lognormal(x, y0, vm, vmin=None, vmax=None, gradient=False):
+    """Evaluates log-normal bands.
+
+    :param x: wavelengths (nm).
+    :param y0: amplitude.
+    :param vm: wavelength of the maximum.
+    :param vmin: wavelength limit, as LNFun's vmin. (Default value = None)
+    :param vmax: wavelength limit, as LNFun's vmax. (Default value = None)
+    :param gradient: also return the derivatives of the band with respect
+                     to y0, vm, vmin and vmax. (Default value = False)
+    :returns: y, or y and a dict of derivatives. Without vmin and vmax,
+              the derivative with respect to vm includes their dependence
+              on vm.
+    """
+    k = NM/np.asarray(x, dtype=float)
+    y0 = np.asarray(y0, dtype=float)
+    v, lo, hi = wavenumbers(vm, vmin, vmax)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = (v - lo)/(hi - v)
+        q = p/(p**2 - 1)
+        a = v + (hi - lo)*q
+        logp = np.log(p)
+        u = np.log((a - k)/(a - v))
+        e = np.exp(-LN2/logp**2*u**2)
+        valid = np.isfinite(e)
+        e = np.where(valid, e, 0.)
+        y = y0*e
+        if not gradient:
+            return y
+
+        # Derivatives of log(y) with respect to p, a and v (direct).
+        dlp = 2*LN2*u**2/(logp**3*p)
+        dla = -2*LN2*u/logp**2*(1/(a - k) - 1/(a - v))
+        dlv = -2*LN2*u/logp**2/(a - v)
+        # Derivatives of p and a with respect to v, lo and hi.
+        dq = -(p**2 + 1)/(p**2 - 1)**2
+        dp_v = (hi - lo)/(hi - v)**2
+        dp_lo = -1/(hi - v)
+        dp_hi = -(v - lo)/(hi - v)**2
+        da_v = 1 + (hi - lo)*dq*dp_v
+        da_lo = -q + (hi - lo)*dq*dp_lo
+        da_hi = q + (hi - lo)*dq*dp_hi
+        dy_v = y*(dlp*dp_v + dla*da_v + dlv)
+        dy_lo = y*(dlp*dp_lo + dla*da_lo)
+        dy_hi = y*(dlp*dp_hi + dla*da_hi)
+        dy_v, dy_lo, dy_hi = [np.where(valid, d, 0.)
+                              for d in (dy_v, dy_lo, dy_hi)]
+
+    vm = np.asarray(vm, dtype=float)
+    grad = {'y0': e*np.ones_like(y0)}
+    if vmin is None:
+        dlo, dhi = band_limits(v)[2:]
+        grad['vm'] = (dy_v + dy_lo*dlo + dy_hi*dhi)*(-NM/vm**2)
+    else:
+        grad['vm'] = dy_v*(-NM/vm**2)
+        grad['vmin'] = dy_hi*(-NM/np.asarray(vmin, dtype=float)**2)
+        grad['vmax'] = dy_lo*(-NM/np.asarray(vmax, dtype=float)**2)
+    return y, grad
+
+
+def bands(x, params, gradient=False):
+    """Evaluates the sum of N log-normal bands for many spectra at once.
+
+    :param x: wavelengths (points,).
+    :param params: array (..., bands, 4) with the y0, vm, vmin and vmax of
+                   every band.
+    :param gradient: also return the Jacobian. (Default value = False)
+    :returns: the model (..., points), or the model and the Jacobian
+              (..., points, bands*4), with the parameters in the order of
+              params.
+    """
+    params = np.asarray(params, dtype=float)[..., np.newaxis]
+    y0, vm, vmin, vmax = np.moveaxis(params, -2, 0)
+    if not gradient:
+        return lognormal(x, y0, vm, vmin, vmax).sum(axis=-2)
+    y, grad = lognormal(x, y0, vm, vmin, vmax, gradient=True)
+    jac = np.stack([np.broadcast_to(grad[name], y.shape)
+                    for name in ('y0', 'vm', 'vmin', 'vmax')], axis=-1)
+    jac = np.moveaxis(jac, -3, -2)
+    return y.sum(axis=-2), jac.reshape(jac.shape[:-2] + (-1,))
+
+
+@lru_cache(maxsize=16)
+def legendre(points):
+    return np.polynomial.legendre.leggauss(points)
+
+
+def quadrature(xmin, xmax, points=256):
+    """Gauss-Legendre nodes and weights on [xmin, xmax]."""
+    t, w = legendre(points)
+    half = (xmax - xmin)/2
+    return xmin + half*(t + 1), w*half
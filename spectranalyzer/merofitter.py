@@ -13,19 +13,21 @@
 # You should have received a copy of the GNU General Public License
 # along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
 
-from lmfit import Parameters
-from .lnfitter import LNFitter
-from .lnfun import LNFun
-from .water import WaterLN
-import matplotlib.pyplot as plt
+from .lnfitter import LNFitter, ColumnFits
+from .presets import get_preset
 import numpy as np
 import pandas as pd
 import os
 # from .fitter import Fitter
 from .spectra import Spectra
+from .report import ReportBuilder
+from .uncertainty import AreaQuantities
+from .lazy import lazy_import
 
+plt = lazy_import("matplotlib.pyplot")
 
-class MeroFitter(Spectra):
+
+class MeroFitter(ColumnFits, AreaQuantities, Spectra):
     def __init__(self, title=None, ylabel=None, legend_title=None,
                  label_fun=None, xlabel=None):
         super().__init__(title, ylabel, legend_title, label_fun)
@@ -33,91 +35,82 @@ class MeroFitter(Spectra):
         self.fits = []
         self.xlabel = xlabel
         self.report = pd.DataFrame()
+        self.report_builder = ReportBuilder()
+
+    def ratios(self, data):
+        if "MonomerPhase" in data:
+            return {"EquilDim": data["DimerPhase"]/data["MonomerPhase"]**2,
+                    "EquilMem": data["MonomerPhase"]/data["Water"]}
+        return {"Equil0": data["DimerWater"]/data["MonomerWater"]**2}
 
     def create_column_report(self, fitter, colname):
         x = np.asarray(self.data.index)
-        data = pd.Series(name=colname)
-        totarea = 0
-        areas = []
-        for fun in fitter.multiln.lnfuns:
-            data[f"{fun.name}"] = fun.calculate_area(x)
-            areas.append(f"{fun.name}")
-            totarea = totarea + data[f"{fun.name}"]
+        funs = fitter.multiln.lnfuns
+        derived = self.derived_quantities(
+            [fun.name for fun in funs], [fun.calculate_area(x) for fun in funs])
+        data = {}
+        for fun in funs:
+            data[f"{fun.name}"] = derived[fun.name]
             data[f"Vm{fun.name}"] = fun.params["vm"].value
             data[f"y0{fun.name}"] = fun.params["y0"].value
-        for area in areas:
-            data[f"{area}norm"] = data[area] / totarea * 100
-        data[f"EquilDim"] = data["DimerPhase"]/(data["MonomerPhase"])**2
-        data[f"EquilMem"] = data["MonomerPhase"]/data["Water"]
+        data.update(derived)
         return data
 
     def get_components(self, y0max, kind="Water", vary=True):
-        param_mono = Parameters()
-        param_dim = Parameters()
-        if kind == "Water":
-            param_mono.add('y0', value=y0max/2., min=0., max=y0max)
-            param_mono.add('vm', value=573, max=600, vary=vary)
-            param_mono.add('vmin', value=554, vary=vary)
-            param_mono.add('vmax', value=594, vary=vary)
-            param_dim.add('y0', value=y0max/2., min=0., max=y0max)
-            param_dim.add('vm', value=612, min=580,
-                          max=625, vary=vary)
-            param_dim.add('vmin', value=594, vary=vary)
-            param_dim.add('vmax', value=640, vary=vary)
-        elif kind == "Phase":
-            param_mono.add('y0', value=y0max/2., min=0., max=y0max)
-            param_mono.add('vm', value=585, max=600, vary=True)
-            param_mono.add('vmin', value=572, vary=vary)
-            param_mono.add('vmax', value=596, vary=vary)
-            param_dim.add('y0', value=y0max/2., min=0., max=y0max)
-            param_dim.add('vm', value=626, min=580,
-                          max=625, vary=True)
-            param_dim.add('vmin', value=604, vary=vary)
-            param_dim.add('vmax', value=666, vary=vary)
-
-        monomero = LNFun(param_mono)
-        monomero.name = f"Monomer{kind}"
-        dimero = LNFun(param_dim)
-        dimero.name = f"Dimer{kind}"
-
-        return monomero, dimero
-
-    def fit_column(self, col, plot=False, interphase=False):
-        fitter = LNFitter(self.data[col], fittype="Mero")
-
-        # Maximum cannot be more than, well, the maximum value.
-        y0max = fitter.data.max().max()
+        preset = get_preset(f"MC540-{kind.replace('Phase', 'Interphase')}")
+        return tuple(preset.create_components(y0max, vary=vary)[-2:])
 
+    def create_fitter(self, col, interphase=False, vary=True):
         if interphase:
-            fitter.multiln.add_LN(WaterLN())
-            lnphase_monomero, lnphase_dimero = self.get_components(
-                                               y0max, kind="Phase")
-            # , vary=True)
-            fitter.multiln.add_LN(lnphase_monomero)
-            fitter.multiln.add_LN(lnphase_dimero)
+            preset = "MC540-Interphase"
         else:
-            lnagua_monomero, lnagua_dimero = self.get_components(y0max,
-                                                                 kind="Water")
-            fitter.multiln.add_LN(lnagua_monomero)
-            fitter.multiln.add_LN(lnagua_dimero)
-
-        fitter.fit(plot=plot)
-        if plot:
-            plt.title(f"{self.name} {col}")
-            plt.show()
-
-        ser = self.create_column_report(fitter, col)
-        self.report = pd.concat([self.report, ser], axis=1, sort=False)
-        self.fits.append(fitter)
+            preset = "MC540-Water"
+        fitter = LNFitter.from_preset(self.data[col], preset, vary=vary)
+        if self.weights is not None:
+            fitter.weights = np.asarray(self.weights[col], dtype=float)
+        return fitter
+
+    def fit_column(self, col, plot=False, interphase=False, fitter=None,
+                   compact=False, **kwargs):
+        """Fits a column. kwargs are passed to LNFitter.fit. A fitter that
+        was already fitted (see create_fitters) is only reported.
+
+        :param compact: keep only a CompactFit of the fit in self.fits.
+                        (Default value = False)
+        """
+        if fitter is None:
+            fitter = self.create_fitter(col, interphase)
+        self.add_fit(col, fitter, plot, compact, **kwargs)
 
     def fit_all_columns(self, plot=False, export=False, write_images=False,
-                        interphase=False):
-        self.report = pd.DataFrame()
-
-        for col in self.data.columns:
-            self.fit_column(col, plot, interphase)
-
-        self.report = self.report.transpose()
+                        interphase=False, stream_report=False, vary=True,
+                        compact=False, **kwargs):
+        """Fits every column. kwargs are passed to LNFitter.fit.
+
+        :param vary: if False, the fixable parameters of the preset do not
+                     vary. When only the amplitudes are left, the columns
+                     are fitted together with fit_linear. (Default value =
+                     True)
+        :param compact: keep only a CompactFit of each fit, so the memory
+                        used does not grow with the curves and lmfit objects
+                        of every column. (Default value = False)
+        """
+        report_file = None
+        if stream_report:
+            try:
+                os.mkdir(self.name)
+            except FileExistsError:
+                pass
+            report_file = f"{self.name}{os.path.sep}{self.name}-report.csv"
+        self.report_builder = ReportBuilder(report_file)
+
+        with self.report_builder:
+            for col, fitter in self.create_fitters(interphase, vary=vary,
+                                                   **kwargs):
+                self.fit_column(col, plot, interphase, fitter, compact,
+                                **kwargs)
+
+        self.report = self.report_builder.to_dataframe()
 
         if export:
             self.export_fits(write_images)
@@ -130,6 +123,7 @@ class MeroFitter(Spectra):
             pass
 
         for fit in self.fits:
+            fit = fit.restore()
             fit.multiln.create_dataframe(np.asarray(self.data.index))
             data = pd.concat([fit.multiln.df, fit.data], axis=1)
             data.to_csv(f"{self.name}{os.path.sep}{fit.data.name}.csv")
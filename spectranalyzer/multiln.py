@@ -20,6 +20,25 @@ import pandas as pd
 class MultiLN():
     def __init__(self):
         self.lnfuns = []
+        self._df = None
+        self.last = None
+
+    @property
+    def df(self):
+        """DataFrame with every component and the Total, for the last x
+        evaluated. evaluate only keeps the arrays; the DataFrame is built
+        when it is asked for."""
+        if self._df is None and self.last is not None:
+            x, ys, total = self.last
+            self._df = pd.DataFrame(index=x)
+            for lnfun, y in zip(self.lnfuns, ys):
+                self._df[lnfun.name] = pd.Series(data=y, index=x)
+            self._df["Total"] = pd.Series(data=total, index=x)
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
 
     def add_LN(self, lnfun):
         self.lnfuns.append(lnfun)
@@ -34,15 +53,16 @@ class MultiLN():
                 return fun
 
     def evaluate(self, x):
-        self.create_dataframe(x)
-        return np.asarray(self.df["Total"])
-
-    def create_dataframe(self, x):
-        self.df = pd.DataFrame(index=x)
         total = np.zeros(x.shape)
+        ys = []
         for lnfun in self.lnfuns:
             y = lnfun.evaluate(x)
-            total = total + y
-            self.df[lnfun.name] = pd.Series(data=y, index=x)
-        self.df["Total"] = pd.Series(data=total, index=x)
+            total += y
+            ys.append(y)
+        self.last = (x, ys, total)
+        self._df = None
+        return total
+
+    def create_dataframe(self, x):
+        self.evaluate(x)
         return self.df
@@ -0,0 +1,79 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Noise models for the weights of the fit residuals."""
+
+import warnings
+import numpy as np
+
+
+def noise_weights(y, noise="poisson", sd=None, floor=None):
+    """The weights of the residuals, the inverse standard deviation of every
+    point of y (a spectrum or a matrix of spectra as columns) for a noise
+    model:
+
+    - "poisson": the square root of the intensity. Intensities below floor
+      times the maximum of the column (0.01 by default) are raised to it.
+    - "replicates": sd, the standard deviation of the replicates of every
+      point, e.g. Spectra.sd. Deviations below floor times the median of
+      the column (0.1 by default) are raised to it, and points without a
+      deviation, e.g. with a single replicate, take the median.
+    - an array: the standard deviation of every point, used as is.
+
+    Other points without a positive deviation get a NaN weight, so the fits
+    leave them out as missing data. A column with data but no weights at
+    all, e.g. a label measured once, raises a ValueError.
+
+    :returns: an array with the shape of y.
+    """
+    y = np.asarray(y, dtype=float)
+    with warnings.catch_warnings():
+        # The columns without any estimate are reported below.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        sigma = _sigma(y, noise, sd, floor)
+    if sigma.shape != y.shape:
+        raise ValueError("The noise must have the shape of the data")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(sigma > 0, 1/sigma, np.nan)
+    empty = np.isnan(weights).all(axis=0) & np.isfinite(y).any(axis=0)
+    if np.any(empty):
+        columns = np.flatnonzero(empty) if y.ndim > 1 else ""
+        raise ValueError(f"No noise estimate for the column(s) {columns}")
+    return weights
+
+
+def _sigma(y, noise, sd, floor):
+    """The standard deviation of every point for noise_weights."""
+    if isinstance(noise, str):
+        if noise == "poisson":
+            floor = 0.01 if floor is None else floor
+            sigma = np.abs(y)
+            scale = np.nanmax(sigma, axis=0)
+        elif noise == "replicates":
+            if sd is None:
+                raise ValueError("The replicates noise model needs sd")
+            floor = 0.1 if floor is None else floor
+            sigma = np.array(sd, dtype=float)
+            scale = np.nanmedian(np.where(sigma > 0, sigma, np.nan), axis=0)
+        else:
+            raise ValueError(f"Unknown noise model {noise}")
+        if noise == "replicates":
+            sigma = np.where(np.isnan(sigma), scale, sigma)
+        # Missing intensities stay missing.
+        sigma = np.maximum(sigma, floor*scale)
+        if noise == "poisson":
+            sigma = np.sqrt(sigma)
+        return sigma
+    return np.asarray(noise, dtype=float)
@@ -13,21 +13,155 @@
 # You should have received a copy of the GNU General Public License
 # along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
 
+import numpy as np
+import pandas as pd
+
+FIELDS = ('value', 'stderr', 'min', 'max', 'vary')
+DTYPE = np.dtype([('value', float), ('stderr', float), ('min', float),
+                  ('max', float), ('vary', bool)])
+EMPTY = (np.nan, np.nan, np.nan, np.nan, False)
+
+
 class ParamList():
+    """History of fitted parameter sets, stored as one structured array
+    (value, stderr, min, max, vary) per parameter name plus the status of
+    each fit. The arrays grow by doubling, so appending a fit does not copy
+    the previous ones and a column is read without touching each fit.
+
+    Rows where a parameter is missing have NaN values and vary False.
+    """
+    __slots__ = ('arrays', 'success', 'chisqr', 'labels', 'size')
+
     def __init__(self):
-        self.params = []
-    
-    def append(self, item):
-        self.params.append(item)
-    
+        self.arrays = {}
+        self.success = np.zeros(0, dtype=bool)
+        self.chisqr = np.zeros(0)
+        self.labels = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def names(self):
+        return list(self.arrays)
+
+    def reserve(self, size):
+        """Makes room for at least size rows."""
+        capacity = len(self.success)
+        if size <= capacity:
+            return
+        capacity = max(size, 2*capacity, 16)
+        for name, array in self.arrays.items():
+            self.arrays[name] = self.grow(array, capacity)
+        self.success = np.concatenate(
+            [self.success, np.zeros(capacity - len(self.success), bool)])
+        self.chisqr = np.concatenate(
+            [self.chisqr, np.full(capacity - len(self.chisqr), np.nan)])
+
+    @staticmethod
+    def grow(array, capacity):
+        grown = np.empty(capacity, dtype=DTYPE)
+        grown[:len(array)] = array
+        grown[len(array):] = EMPTY
+        return grown
+
+    def column_array(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = self.grow(np.empty(0, dtype=DTYPE),
+                                          len(self.success))
+        return self.arrays[name]
+
+    def append(self, item, label=None):
+        """Adds a fit.
+
+        :param item: a lmfit Parameters, or a fit result with params and
+                     optionally success and chisqr (MinimizerResult).
+        :param label: the name of the fit, e.g. its column.
+                      (Default value = None)
+        """
+        params = getattr(item, 'params', item)
+        self.reserve(self.size + 1)
+        row = self.size
+        for name, param in params.items():
+            self.column_array(name)[row] = (
+                param.value, np.nan if param.stderr is None else param.stderr,
+                param.min, param.max, param.vary)
+        self.success[row] = getattr(item, 'success', True)
+        self.chisqr[row] = getattr(item, 'chisqr', np.nan)
+        self.labels.append(label)
+        self.size += 1
+
+    def append_arrays(self, names, values, stderrs=None, success=None,
+                      chisqr=None, labels=None):
+        """Adds many fits at once, e.g. the result of helpers.fitln.
+
+        :param names: the parameter names (parameters,).
+        :param values: array (fits, parameters).
+        :param stderrs: array (fits, parameters). (Default value = None)
+        :param success: array (fits,). (Default value = None)
+        :param chisqr: array (fits,). (Default value = None)
+        :param labels: the names of the fits. (Default value = None)
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        count = len(values)
+        self.reserve(self.size + count)
+        rows = slice(self.size, self.size + count)
+        for j, name in enumerate(names):
+            array = self.column_array(name)
+            array['value'][rows] = values[:, j]
+            if stderrs is not None:
+                array['stderr'][rows] = np.asarray(stderrs)[:, j]
+            array['vary'][rows] = True
+        self.success[rows] = True if success is None else success
+        if chisqr is not None:
+            self.chisqr[rows] = chisqr
+        self.labels.extend([None]*count if labels is None else labels)
+        self.size += count
+
+    def column(self, parameter, field='value'):
+        """The field of a parameter for every fit, as an array."""
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field {field}")
+        return self.arrays[parameter][field][:self.size]
+
     def values(self, parameter):
-        values = []
-        for item in self.params:
-            values.append(item[parameter].value)
-        return values
-    
+        return self.column(parameter, 'value')
+
     def stderrs(self, parameter):
-        values = []
-        for item in self.params:
-            values.append(item[parameter].stderr)
-        return values
\ No newline at end of file
+        """The standard errors of a parameter, NaN where unknown."""
+        return self.column(parameter, 'stderr')
+
+    def filter(self, mask):
+        """A new ParamList with the fits selected by mask, a boolean array
+        or indices, e.g. params.filter(params.success)."""
+        rows = np.asarray(mask)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows[:self.size])
+        selected = ParamList()
+        selected.arrays = {name: array[rows]
+                           for name, array in self.arrays.items()}
+        selected.success = self.success[rows]
+        selected.chisqr = self.chisqr[rows]
+        selected.labels = [self.labels[i] for i in rows]
+        selected.size = len(rows)
+        return selected
+
+    def to_dataframe(self, fields=('value', 'stderr')):
+        """One row per fit. The value of each parameter is in the column
+        with its name, the other fields in name_field columns."""
+        data = {}
+        for name in self.arrays:
+            for field in fields:
+                column = name if field == 'value' else f"{name}_{field}"
+                data[column] = self.column(name, field)
+        data['success'] = self.success[:self.size]
+        data['chisqr'] = self.chisqr[:self.size]
+        index = None if all(label is None for label in self.labels) \
+            else self.labels
+        return pd.DataFrame(data, index=index)
+
+    def to_parquet(self, path, fields=FIELDS):
+        """Writes to_dataframe to a Parquet file (needs pyarrow or
+        fastparquet)."""
+        self.to_dataframe(fields).to_parquet(path)
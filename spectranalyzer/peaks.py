@@ -0,0 +1,131 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Peak positions of every spectrum of a matrix at once.
+
+The functions receive the wavelengths x (points,) and the intensities y
+(points, spectra), as in Spectra.data, and return one value per spectrum.
+"""
+
+import numpy as np
+from .lazy import lazy_import
+
+ndimage = lazy_import("scipy.ndimage")
+
+
+def maxima(x, y):
+    """Grid maximum of every spectrum, ignoring NaNs.
+
+    :returns: the index of the maximum, its wavelength and its intensity.
+    """
+    y = np.where(np.isnan(y), -np.inf, y)
+    index = y.argmax(axis=0)
+    height = np.take_along_axis(y, index[np.newaxis], axis=0)[0]
+    return index, np.asarray(x)[index], height
+
+
+def neighbours(x, y, index):
+    """The points before and at the maximum and after it. At the ends of
+    the grid the maximum is repeated, so the peak stays on the grid."""
+    x = np.asarray(x, dtype=float)
+    before = np.clip(index - 1, 0, len(x) - 1)
+    after = np.clip(index + 1, 0, len(x) - 1)
+    edge = (before == index) | (after == index)
+    before = np.where(edge, index, before)
+    after = np.where(edge, index, after)
+    columns = np.arange(y.shape[1])
+    return ((x[before], x[index], x[after]),
+            (y[before, columns], y[index, columns], y[after, columns]),
+            edge)
+
+
+def vertex(xs, ys, edge):
+    """Abscissa of the vertex of the parabola through three points."""
+    (x0, x1, x2), (y0, y1, y2) = xs, ys
+    with np.errstate(divide='ignore', invalid='ignore'):
+        num = (x1 - x0)**2*(y1 - y2) - (x1 - x2)**2*(y1 - y0)
+        den = (x1 - x0)*(y1 - y2) - (x1 - x2)*(y1 - y0)
+        position = x1 - num/(2*den)
+    valid = ~edge & np.isfinite(position) & (position >= x0) & \
+        (position <= x2)
+    return np.where(valid, position, x1)
+
+
+def parabolic(x, y, index):
+    """Sub-grid peak positions from a parabola through the maximum and its
+    neighbours."""
+    xs, ys, edge = neighbours(x, y, index)
+    return vertex(xs, ys, edge)
+
+
+def gaussian(x, y, index):
+    """Sub-grid peak positions from a Gaussian through the maximum and its
+    neighbours, that is, a parabola through the log of the intensities.
+    Falls back to the grid maximum where any intensity is not positive."""
+    xs, ys, edge = neighbours(x, y, index)
+    positive = (ys[0] > 0) & (ys[1] > 0) & (ys[2] > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = tuple(np.log(np.where(positive, yi, 1.)) for yi in ys)
+    return vertex(xs, logs, edge | ~positive)
+
+
+def centroids(x, y, threshold=0.5):
+    """Intensity weighted mean wavelength of every spectrum, using only the
+    points above threshold times its maximum.
+
+    :param threshold: fraction of the maximum. (Default value = 0.5)
+    """
+    x = np.asarray(x, dtype=float)[:, np.newaxis]
+    y = np.where(np.isnan(y), 0., y)
+    weights = np.where(y >= threshold*y.max(axis=0), y, 0.)
+    weights = np.clip(weights, 0., None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (weights*x).sum(axis=0)/weights.sum(axis=0)
+
+
+def smooth(y, window):
+    """Moving average of every spectrum over window points."""
+    return ndimage.uniform_filter1d(y, window, axis=0, mode='nearest')
+
+
+def track(x, y, method="parabolic", window=None, threshold=0.5):
+    """Peak parameters of every spectrum of a matrix.
+
+    :param x: wavelengths (points,).
+    :param y: intensities (points, spectra).
+    :param method: sub-grid method, "parabolic", "gaussian" or "grid".
+                   (Default value = "parabolic")
+    :param window: if given, the spectra are smoothed with a moving average
+                   of that many points first. (Default value = None)
+    :param threshold: fraction of the maximum used for the centroids.
+                      (Default value = 0.5)
+    :returns: dict of arrays with the index, wavelength and intensity of
+              the grid maximum, the sub-grid position and the centroid.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if window:
+        y = smooth(y, window)
+    index, maximum, height = maxima(x, y)
+    if method == "parabolic":
+        position = parabolic(x, y, index)
+    elif method == "gaussian":
+        position = gaussian(x, y, index)
+    elif method == "grid":
+        position = maximum
+    else:
+        raise ValueError(f"Unknown method {method}")
+    return {"index": index, "maximum": maximum, "height": height,
+            "position": position, "centroid": centroids(x, y, threshold)}
@@ -0,0 +1,207 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+from .lnfun import LNFun
+from .water import WaterLN
+from .lazy import lazy_import
+
+lmfit = lazy_import("lmfit")
+
+
+class ModelPreset():
+    """A named model: the components used to fit a spectrum, with the
+    starting values, bounds and vary flags of their parameters.
+
+    The flattened parameter layout and its bound vectors are computed once,
+    when the preset is created. Setting up the fit of a column then only
+    scales the amplitudes to the maximum of the data.
+
+    :param name: the name the preset is registered with.
+    :param components: list of (name, params) or (name, params, class)
+                       tuples. params maps each parameter name to a dict with
+                       its value and, optionally, min, max, vary, scaled
+                       (value and max are fractions of the data maximum) and
+                       fixable (the parameter is fixed when the preset is
+                       set up with vary=False).
+    :param fittype: the fittype given to the LNFitter. (Default value = None)
+    :param label: a human readable name. (Default value = None)
+    """
+    def __init__(self, name, components, fittype=None, label=None):
+        self.name = name
+        self.fittype = fittype
+        self.label = label or name
+        self.components = []
+        self.layout = []
+        values, mins, maxs, varies, scaled, fixable = [], [], [], [], [], []
+        for component in components:
+            cname, cparams = component[:2]
+            cls = component[2] if len(component) > 2 else LNFun
+            self.components.append((cname, cls))
+            for pname, spec in cparams.items():
+                self.layout.append((len(self.components) - 1, pname,
+                                    f"{cname.replace('-', '')}{pname}"))
+                values.append(spec["value"])
+                mins.append(spec.get("min", -np.inf))
+                maxs.append(spec.get("max", np.inf))
+                varies.append(spec.get("vary", True))
+                scaled.append(spec.get("scaled", False))
+                fixable.append(spec.get("fixable", False))
+        self.names = [fullname for _, _, fullname in self.layout]
+        self.values = np.asarray(values, dtype=float)
+        self.mins = np.asarray(mins, dtype=float)
+        self.maxs = np.asarray(maxs, dtype=float)
+        self.vary = np.asarray(varies, dtype=bool)
+        self.scaled = np.asarray(scaled, dtype=bool)
+        self.fixable = np.asarray(fixable, dtype=bool)
+
+    def bounds(self, y0max=1.):
+        """Returns the values, min and max vectors scaled to y0max."""
+        scale = np.where(self.scaled, y0max, 1.)
+        return (self.values * scale, self.mins * scale, self.maxs * scale)
+
+    def varies(self, vary=True):
+        if vary:
+            return self.vary
+        return self.vary & ~self.fixable
+
+    def create_components(self, y0max, vary=True):
+        """Returns new component objects with their own Parameters.
+
+        :param y0max: the maximum of the data to fit.
+        :param vary: if False, the fixable parameters do not vary.
+                     (Default value = True)
+        """
+        values, mins, maxs = self.bounds(y0max)
+        varies = self.varies(vary)
+        params = [lmfit.Parameters() for _ in self.components]
+        for i, (comp, pname, _) in enumerate(self.layout):
+            params[comp].add(pname, value=values[i], min=mins[i],
+                             max=maxs[i], vary=bool(varies[i]))
+        funs = []
+        for (cname, cls), cparams in zip(self.components, params):
+            fun = cls(cparams)
+            fun.name = cname
+            funs.append(fun)
+        return funs
+
+    def setup(self, fitter, vary=True):
+        """Adds the components to an LNFitter and sets its flattened
+        parameters and layout, so the fit does not need to rebuild them.
+
+        :param fitter: the LNFitter, with its data already set.
+        :param vary: if False, the fixable parameters do not vary.
+                     (Default value = True)
+        """
+        y0max = fitter.data.max()
+        funs = self.create_components(y0max, vary)
+        values, mins, maxs = self.bounds(y0max)
+        varies = self.varies(vary)
+        params = lmfit.Parameters()
+        params.add_many(*[(name, values[i], bool(varies[i]), mins[i],
+                           maxs[i]) for i, name in enumerate(self.names)])
+        for fun in funs:
+            fitter.multiln.add_LN(fun)
+        fitter.params = params
+        fitter.preset = self
+        fitter.paramkeys = [cname.replace('-', '')
+                            for cname, _ in self.components]
+        fitter.layout = [(funs[comp], pname, fullname)
+                         for comp, pname, fullname in self.layout]
+        return fitter
+
+
+PRESETS = {}
+
+
+def register_preset(preset):
+    PRESETS[preset.name] = preset
+    return preset
+
+
+def generic_preset(numln):
+    """Creates the preset with numln generic log-normal components, the
+    first one centered at 416 nm and the rest at 500 nm."""
+    components = []
+    for i in range(numln):
+        vm = 416 if i == 0 else 500
+        vmin, vmax = LNFun().get_vmax_vmin(vm)
+        components.append((f"Component-{i}", {
+            "y0": {"value": .5, "min": 0., "max": 1., "scaled": True},
+            "vm": {"value": vm},
+            "vmin": {"value": vmin},
+            "vmax": {"value": vmax},
+        }))
+    return ModelPreset(f"Generic-{numln}", components,
+                       label=f"{numln} log-normal components")
+
+
+def get_preset(name):
+    """Returns the registered preset. Generic-N presets are created and
+    registered the first time they are requested."""
+    if name not in PRESETS:
+        if not name.startswith("Generic-"):
+            raise ValueError(f"Unknown preset {name}")
+        register_preset(generic_preset(int(name.split("-")[1])))
+    return PRESETS[name]
+
+
+AMPLITUDE = {"value": .5, "min": 0., "max": 1., "scaled": True}
+
+register_preset(ModelPreset("Laurdan", [
+    ("Relaxed", {
+        "y0": AMPLITUDE,
+        "vm": {"value": 10**7/20000, "min": 10**7/21300},
+    }),
+    ("NonRelaxed", {
+        "y0": AMPLITUDE,
+        "vm": {"value": 10**7/24000, "min": 10**7/26000,
+               "max": 10**7/22300},
+    }),
+], fittype="Mero", label="Laurdan"))
+
+register_preset(ModelPreset("MC540-Water", [
+    ("MonomerWater", {
+        "y0": AMPLITUDE,
+        "vm": {"value": 573, "max": 600, "fixable": True},
+        "vmin": {"value": 554, "fixable": True},
+        "vmax": {"value": 594, "fixable": True},
+    }),
+    ("DimerWater", {
+        "y0": AMPLITUDE,
+        "vm": {"value": 612, "min": 580, "max": 625, "fixable": True},
+        "vmin": {"value": 594, "fixable": True},
+        "vmax": {"value": 640, "fixable": True},
+    }),
+], fittype="Mero", label="MC540 (water)"))
+
+register_preset(ModelPreset("MC540-Interphase", [
+    ("Water", {
+        "y0": {"value": 1, "min": 0},
+        "vm": {"value": 1, "vary": False},
+    }, WaterLN),
+    ("MonomerPhase", {
+        "y0": AMPLITUDE,
+        "vm": {"value": 585, "max": 600},
+        "vmin": {"value": 572, "fixable": True},
+        "vmax": {"value": 596, "fixable": True},
+    }),
+    ("DimerPhase", {
+        "y0": AMPLITUDE,
+        "vm": {"value": 626, "min": 580, "max": 625},
+        "vmin": {"value": 604, "fixable": True},
+        "vmax": {"value": 666, "fixable": True},
+    }),
+], fittype="Mero", label="MC540 (interphase)"))
@@ -0,0 +1,91 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+import csv
+import pandas as pd
+
+
+class ReportBuilder():
+    """Collects one report row per fitted column and builds the report
+    DataFrame only once, when all the fits are done. The report columns are
+    every field of any row, in the order they first appear.
+
+    Use it as a context manager, or close it, so the CSV file is closed if
+    a fit fails.
+
+    :param filename: if specified, every row is also appended to this CSV
+                     file as soon as it is added. (Default value = None)
+    """
+    def __init__(self, filename=None):
+        self.names = []
+        self.rows = []
+        self.columns = []
+        self.filename = filename
+        self.file = None
+        self.writer = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_row(self, name, row):
+        """Adds the report row of a column.
+
+        :param name: the name of the fitted column (report index).
+        :param row: dict mapping each report field to its value.
+        """
+        new = [col for col in row if col not in self.columns]
+        self.columns.extend(new)
+        self.names.append(name)
+        self.rows.append(row)
+        if self.filename is not None:
+            if new:
+                # The header changes, the rows written so far are written
+                # again below it.
+                self.close()
+                self.open()
+                for written, previous in zip(self.names[:-1],
+                                             self.rows[:-1]):
+                    self.write_row(written, previous)
+            self.write_row(name, row)
+            self.file.flush()
+
+    def open(self):
+        self.file = open(self.filename, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([""] + self.columns)
+
+    def write_row(self, name, row):
+        if self.writer is None:
+            self.open()
+        self.writer.writerow([name] + [row.get(col, "")
+                                       for col in self.columns])
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.writer = None
+
+    def to_dataframe(self):
+        """Returns the report as a DataFrame, one row per fitted column."""
+        self.close()
+        return pd.DataFrame.from_records(self.rows, index=self.names,
+                                         columns=self.columns or None)
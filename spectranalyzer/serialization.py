@@ -0,0 +1,139 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Compact binary format for fit results.
+
+A packed result is the MAGIC bytes, the length of a JSON header as a
+little-endian uint32, the header itself and then the float64 blocks listed
+in the header, one after the other and in C order:
+
+    x           (points,)
+    data        (columns, points)
+    components  (columns, components + 1, points), the last one is the total
+    values      (columns, params)
+    stderrs     (columns, params), NaN when not available
+"""
+
+import json
+import struct
+import numpy as np
+import pandas as pd
+
+MAGIC = b"SPAN"
+VERSION = 1
+DTYPE = np.dtype("<f8")
+
+
+def pack_results(fitter):
+    """Packs the fits of a LaurdanFitter, MeroFitter or Fitter into bytes.
+
+    All the fits must share the same wavelength grid and components, as it
+    is the case for the columns of a single experiment.
+
+    :param fitter: the fitter, after fit_all_columns.
+    :returns: bytes
+    """
+    fits = fitter.fits
+    x = np.asarray(fits[0].data.index, dtype=float)
+    first = fits[0].restore()
+    funs = first.multiln.lnfuns
+    names = [fun.name for fun in funs]
+    params = list(first.out.params)
+
+    data = np.empty((len(fits), x.size))
+    components = np.empty((len(fits), len(funs) + 1, x.size))
+    values = np.empty((len(fits), len(params)))
+    stderrs = np.full((len(fits), len(params)), np.nan)
+    for i, fit in enumerate(fits):
+        fit = fit.restore()
+        data[i] = np.asarray(fit.data, dtype=float)
+        for j, fun in enumerate(fit.multiln.lnfuns):
+            components[i, j] = fun.evaluate(x)
+        components[i, -1] = components[i, :-1].sum(axis=0)
+        for j, param in enumerate(fit.out.params.values()):
+            values[i, j] = param.value
+            if param.stderr is not None:
+                stderrs[i, j] = param.stderr
+
+    header = {
+        "version": VERSION,
+        "name": fitter.name,
+        "columns": [fit.data.name for fit in fits],
+        "components": names + ["Total"],
+        "params": params,
+        "points": int(x.size),
+    }
+    header = json.dumps(header, default=float).encode()
+    blocks = [x, data, components, values, stderrs]
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header] +
+                    [block.astype(DTYPE, copy=False).tobytes()
+                     for block in blocks])
+
+
+def unpack_results(buffer):
+    """Reads results packed by pack_results. The arrays are views on the
+    buffer, nothing is copied.
+
+    :param buffer: bytes, bytearray or memoryview.
+    :returns: dict with the name, the data DataFrame (one column per
+              spectrum), the components (dict of DataFrames, one per
+              component plus the Total) and the values and stderrs of the
+              parameters (DataFrames, one row per spectrum).
+    """
+    buffer = memoryview(buffer)
+    if bytes(buffer[:4]) != MAGIC:
+        raise ValueError("Not a packed SpectrAnalyzer result")
+    (length,) = struct.unpack("<I", buffer[4:8])
+    header = json.loads(bytes(buffer[8:8 + length]).decode())
+    if header["version"] != VERSION:
+        raise ValueError(f"Unsupported version {header['version']}")
+
+    ncols = len(header["columns"])
+    ncomps = len(header["components"])
+    nparams = len(header["params"])
+    npoints = header["points"]
+    shapes = [(npoints,), (ncols, npoints), (ncols, ncomps, npoints),
+              (ncols, nparams), (ncols, nparams)]
+    offset = 8 + length
+    blocks = []
+    for shape in shapes:
+        count = int(np.prod(shape))
+        blocks.append(np.frombuffer(buffer, dtype=DTYPE, count=count,
+                                    offset=offset).reshape(shape))
+        offset += count * DTYPE.itemsize
+    x, data, components, values, stderrs = blocks
+
+    columns = header["columns"]
+    return {
+        "name": header["name"],
+        "data": pd.DataFrame(data.T, index=x, columns=columns),
+        "components": {name: pd.DataFrame(components[:, i].T, index=x,
+                                          columns=columns)
+                       for i, name in enumerate(header["components"])},
+        "values": pd.DataFrame(values, index=columns,
+                               columns=header["params"]),
+        "stderrs": pd.DataFrame(stderrs, index=columns,
+                                columns=header["params"]),
+    }
+
+
+def write_results(fitter, filename):
+    with open(filename, "wb") as f:
+        f.write(pack_results(fitter))
+
+
+def read_results(filename):
+    with open(filename, "rb") as f:
+        return unpack_results(f.read())
@@ -14,11 +14,81 @@
 # along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
 
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 from glob import glob
 import re
-from scipy.interpolate import interp1d
+import warnings
+from . import chunked, peaks
+from .noise import noise_weights
+from .lazy import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
+interpolate = lazy_import("scipy.interpolate")
+signal = lazy_import("scipy.signal")
+
+# Methods of average_replicates.
+AVERAGES = ("mean", "median", "robust")
+
+
+def average_replicates(data, method="mean", threshold=5., window=25):
+    """Averages the columns of data with the same label, all the labels at
+    once. The replicates are stacked in a (points, labels, replicates)
+    array padded with NaN, so replicates measured on other grids or missing
+    points are left out of the averages.
+
+    :param data: DataFrame whose equal column labels are replicates.
+    :param method: "mean", "median" or "robust", the mean of the values
+                   within threshold robust standard deviations of the
+                   median. The robust standard deviation is 1.4826 times
+                   the median absolute deviation from the median, pooled
+                   over the replicates of the window points of the label
+                   with the nearest intensities, so it follows noise that
+                   grows with the intensity and is also meaningful for
+                   triplicates. Points with fewer than three
+                   values keep all of them. (Default value = "mean")
+    :param threshold: see method. (Default value = 5.)
+    :param window: see method. (Default value = 25)
+    :returns: (averages, standard deviations of the values averaged, number
+              of values averaged), DataFrames with one column per label.
+    """
+    if method not in AVERAGES:
+        raise ValueError(f"Unknown average {method}")
+    codes, labels = pd.factorize(data.columns, sort=True)
+    ranks = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    points, replicates = len(data.index), ranks.max() + 1
+    values = np.full((points, len(labels), replicates), np.nan)
+    values[:, codes, ranks] = data.to_numpy(dtype=float)
+    with warnings.catch_warnings():
+        # Points without any replicate stay NaN.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(values, axis=2)
+        if method == "robust":
+            deviation = np.abs(values - median[:, :, np.newaxis])
+            # Pooled over the replicates of the window points nearest in
+            # intensity, as the rows of a rolling window of (point,
+            # replicate) pairs. The value at the median is left out.
+            order = np.argsort(np.abs(median), axis=0)[:, :, np.newaxis]
+            pooled = np.take_along_axis(
+                np.where(deviation > 0, deviation, np.nan), order, axis=0)
+            pooled = pooled.transpose(0, 2, 1).reshape(points*replicates,
+                                                       len(labels))
+            pooled = pd.DataFrame(pooled).rolling(
+                window*replicates, center=True, min_periods=1).median()
+            sigma = np.empty(values.shape)
+            np.put_along_axis(sigma, order, 1.4826*pooled.to_numpy().reshape(
+                points, replicates, len(labels)).transpose(0, 2, 1), axis=0)
+            outlier = (deviation > threshold*sigma) & \
+                (np.sum(~np.isnan(values), axis=2) >= 3)[:, :, np.newaxis]
+            values = np.where(outlier, np.nan, values)
+        averages = median if method == "median" else np.nanmean(values,
+                                                                axis=2)
+        sd = np.nanstd(values, axis=2, ddof=1)
+    counts = np.sum(~np.isnan(values), axis=2)
+
+    def frame(array):
+        return pd.DataFrame(array, index=data.index,
+                            columns=pd.Index(labels, name=data.columns.name))
+    return frame(averages), frame(sd), frame(counts)
 
 
 class Spectra():
@@ -40,6 +110,11 @@ class Spectra():
         self.legend_title = legend_title
         self.data = None
         self.normdata = None
+        self.rawdata = None
+        self.smoothed = None
+        self.weights = None
+        self.sd = None
+        self.counts = None
         self.label_fun = label_fun
 
     def add_column(self, column, labels: list):
@@ -89,8 +164,251 @@ class Spectra():
             newidx.append(float(idx))
         self.data.index = newidx
 
+    def column_groups(self):
+        """Groups the columns that have values at the same wavelengths, that
+        is, the columns that came from files with the same grid.
+
+        :returns: list of (row mask, column positions) tuples.
+        """
+        valid = ~np.isnan(self.data.to_numpy(dtype=float))
+        masks, inverse = np.unique(valid.T, axis=0, return_inverse=True)
+        inverse = np.ravel(inverse)
+        return [(mask, np.flatnonzero(inverse == i))
+                for i, mask in enumerate(masks)]
+
+    def infer_grid(self, step=None):
+        """Returns a uniform grid covering the range where every column has
+        values. The step is, if not given, the coarsest spacing among the
+        original grids.
+
+        :param step: spacing of the grid in nm. (Default value = None)
+
+        """
+        x = np.asarray(self.data.index, dtype=float)
+        start, stop, spacing = -np.inf, np.inf, 0.
+        for mask, _ in self.column_groups():
+            xg = x[mask]
+            start, stop = max(start, xg.min()), min(stop, xg.max())
+            spacing = max(spacing, np.median(np.diff(xg)))
+        if step is None:
+            step = spacing
+        return start + step*np.arange(int((stop - start)/step + 1e-9) + 1)
+
+    def resample(self, grid=None, step=None, kind="linear"):
+        """Moves every column to a common uniform grid, replacing the union
+        of grids (and its NaNs) that results from concatenating files with
+        different grids.
+
+        :param grid: the new wavelengths. If not given, it is inferred with
+                     infer_grid. (Default value = None)
+        :param step: spacing of the inferred grid. (Default value = None)
+        :param kind: "linear" or "cubic" to interpolate, or "bin" to average
+                     the points within step/2 of each new wavelength, which
+                     reduces dense spectra. (Default value = "linear")
+
+        """
+        if grid is None:
+            grid = self.infer_grid(step)
+        grid = np.asarray(grid, dtype=float)
+        x = np.asarray(self.data.index, dtype=float)
+        y = self.data.to_numpy(dtype=float)
+        if kind == "bin":
+            if len(grid) < 2:
+                raise ValueError("Binning needs at least two wavelengths")
+            edges = np.concatenate([[1.5*grid[0] - grid[1]/2],
+                                    (grid[1:] + grid[:-1])/2,
+                                    [1.5*grid[-1] - grid[-2]/2]])
+            bins = np.searchsorted(edges, x) - 1
+            inside = (bins >= 0) & (bins < len(grid))
+            valid = ~np.isnan(y) & inside[:, np.newaxis]
+            sums = np.zeros((len(grid), y.shape[1]))
+            counts = np.zeros((len(grid), y.shape[1]))
+            np.add.at(sums, bins[inside], np.where(valid, y, 0.)[inside])
+            np.add.at(counts, bins[inside], valid[inside])
+            with np.errstate(invalid='ignore'):
+                values = sums/counts
+        else:
+            values = np.empty((len(grid), y.shape[1]))
+            for mask, columns in self.column_groups():
+                f = interpolate.interp1d(x[mask], y[mask][:, columns],
+                                         kind=kind, axis=0,
+                                         bounds_error=False,
+                                         fill_value=np.nan)
+                values[:, columns] = f(grid)
+        self.data = pd.DataFrame(values, index=grid,
+                                 columns=self.data.columns)
+        self.normdata = None
+
+    def smooth_data(self, method="savgol", window=7, order=2,
+                    smoothing=None, weights=False):
+        """Smooths every column along the wavelength axis, all the columns
+        with the same valid points at once. The data before smoothing is
+        kept in self.rawdata, smoothing again (unless the data was replaced
+        since) starts from it. Savitzky-Golay and the moving average assume
+        a uniform grid, see resample.
+
+        :param method: "savgol" (Savitzky-Golay), "average" (moving average)
+                       or "spline" (smoothing spline).
+                       (Default value = "savgol")
+        :param window: number of points of the Savitzky-Golay and moving
+                       average windows. (Default value = 7)
+        :param order: order of the Savitzky-Golay polynomials.
+                      (Default value = 2)
+        :param smoothing: penalty of the smoothing spline, chosen by
+                          generalized cross-validation if None.
+                          (Default value = None)
+        :param weights: also set self.weights, see snr_weights.
+                        (Default value = False)
+        """
+        if self.rawdata is None or self.data is not self.smoothed:
+            self.rawdata = self.data
+        x = np.asarray(self.rawdata.index, dtype=float)
+        y = self.rawdata.to_numpy(dtype=float)
+        values = np.full(y.shape, np.nan)
+        for mask, columns in self.column_groups():
+            block = y[mask][:, columns]
+            if method == "savgol":
+                smoothed = signal.savgol_filter(block, window, order, axis=0,
+                                                mode='interp')
+            elif method == "average":
+                smoothed = peaks.smooth(block, window)
+            elif method == "spline":
+                smoothed = interpolate.make_smoothing_spline(
+                    x[mask], block, lam=smoothing)(x[mask])
+            else:
+                raise ValueError(f"Unknown smoothing method {method}")
+            values[np.ix_(mask, columns)] = smoothed
+        self.data = pd.DataFrame(values, index=self.rawdata.index,
+                                 columns=self.rawdata.columns)
+        self.smoothed = self.data
+        self.normdata = None
+        if weights:
+            self.weights = self.snr_weights()
+
+    def snr_weights(self, window=25, floor=0.1):
+        """Weights for the fits: the inverse of the noise of every point.
+        The noise is the robust (1.4826 times the median absolute) deviation
+        of the difference between the raw and smoothed data over the window
+        points around each point, fitted per column as a + b*intensity
+        (detector plus proportional noise) so that the weights follow the
+        intensity but not the scatter of the local estimates. The residual
+        of a fit is then in units of its noise.
+
+        :param window: number of points of the local estimates.
+                       (Default value = 25)
+        :param floor: the noise is at least floor times the median noise of
+                      its column, so that no point dominates a fit.
+                      (Default value = 0.1)
+        """
+        if self.rawdata is None or self.data is not self.smoothed:
+            raise ValueError("The data is not smoothed, see smooth_data")
+        smoothed = self.data.to_numpy(dtype=float)
+        noise = np.abs(self.rawdata.to_numpy(dtype=float) - smoothed)
+        local = 1.4826*pd.DataFrame(noise).rolling(
+            window, center=True, min_periods=1).median().to_numpy()
+        intensity = np.abs(smoothed)
+        valid = ~np.isnan(local) & ~np.isnan(intensity)
+        count = valid.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_i = np.where(valid, intensity, 0).sum(axis=0)/count
+            mean_s = np.where(valid, local, 0).sum(axis=0)/count
+            di = np.where(valid, intensity - mean_i, 0)
+            slope = (di*np.where(valid, local - mean_s, 0)).sum(axis=0) / \
+                (di**2).sum(axis=0)
+        slope = np.where(np.isfinite(slope), np.maximum(slope, 0), 0)
+        sigma = mean_s - slope*mean_i + slope*intensity
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            scale = np.nanmedian(local, axis=0)
+        # A column without noise keeps the unit weight.
+        sigma = np.where(scale > 0, np.fmax(sigma, floor*scale), 1.)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(sigma > 0, 1/sigma, np.nan)
+        return pd.DataFrame(weights, index=self.data.index,
+                            columns=self.data.columns)
+
+    def set_noise(self, noise="poisson", sd=None, floor=None):
+        """Sets self.weights, the weights of the fits, from a noise model of
+        the data, computed for the whole matrix at once. See
+        noise.noise_weights.
+
+        :param noise: "poisson", "replicates" or a matrix with the standard
+                      deviation of every point. (Default value = "poisson")
+        :param sd: the standard deviation of the replicates. If None, the
+                   standard error of the averages of average_replicates.
+                   A label measured once has no estimate and raises a
+                   ValueError. (Default value = None)
+        :param floor: see noise.noise_weights. (Default value = None)
+        """
+        if noise == "replicates" and sd is None and self.sd is not None:
+            # The points left with a single value take the median deviation
+            # of their label.
+            sd = self.sd.fillna(self.sd.median())/np.sqrt(
+                self.counts.where(self.counts > 0))
+        if isinstance(sd, pd.DataFrame):
+            sd = sd.reindex(index=self.data.index, columns=self.data.columns)
+        if isinstance(noise, pd.DataFrame):
+            noise = noise.reindex(index=self.data.index,
+                                  columns=self.data.columns)
+        self.weights = pd.DataFrame(
+            noise_weights(self.data.to_numpy(dtype=float), noise, sd, floor),
+            index=self.data.index, columns=self.data.columns)
+
+    def average_replicates(self, method="mean", threshold=5., window=25):
+        """Replaces the columns with the same label by their average, see
+        average_replicates. The standard deviations and the number of
+        values averaged at every point are kept in self.sd and
+        self.counts, for set_noise("replicates").
+
+        :param method: "mean", "median" or "robust". (Default value = "mean")
+        :param threshold: outlier threshold of the robust average, in robust
+                          standard deviations. (Default value = 5.)
+        :param window: number of points pooled by the robust average.
+                       (Default value = 25)
+        """
+        self.data, self.sd, self.counts = average_replicates(
+            self.data, method, threshold, window)
+        self.normdata = None
+        self.weights = None
+
+    def load_file(self, filename, chunksize=None, **kwargs):
+        """Reads a matrix of spectra from a single CSV file. The first column
+        holds the wavelengths and every other column is a spectrum.
+
+        :param filename: the CSV file to read.
+        :param chunksize: if given, the file is parsed chunksize rows at a
+                          time and each chunk is kept only as floats, so the
+                          text of the whole file is never held in memory.
+                          (Default value = None)
+        :param kwargs: passed to pandas.read_csv.
+        """
+        if chunksize is None:
+            self.data = pd.read_csv(filename, index_col=0, **kwargs)
+            self.sanitize_data()
+            return
+
+        index = []
+        blocks = []
+        for chunk in pd.read_csv(filename, index_col=0, chunksize=chunksize,
+                                 **kwargs):
+            self.data = chunk
+            self.sanitize_index()
+            self.data = self.data.replace(to_replace=",", value=".",
+                                          regex=True).apply(pd.to_numeric)
+            self.data.dropna(how='all', inplace=True)
+            index.append(self.data.index.to_numpy(dtype=float))
+            blocks.append(self.data.to_numpy(dtype=float))
+        if not sum(len(block) for block in blocks):
+            raise ValueError(f"{filename} has no spectra.")
+        self.data = pd.DataFrame(np.concatenate(blocks),
+                                 index=np.concatenate(index),
+                                 columns=chunk.columns)
+        self.sanitize_columns()
+        self.data.dropna(how='all', axis=1, inplace=True)
+
     def load_csv_data(self, wavelength: int, basedir=None, start=0.,
-                      regex=None, encoding='iso-8859-1'):
+                      regex=None, encoding='iso-8859-1', replicates=None,
+                      threshold=5.):
         """Reads a series of fluorescence spectra from CSV files
         (Exported from Cary Eclipse, for now.)
         Naming convention: The files should be named as follows:
@@ -108,6 +426,11 @@ class Spectra():
                       (Default value = None)
         :param encoding: the encoding of the csv data file to load.
                          (Default value = 'iso-8859-1')
+        :param replicates: "mean", "median" or "robust" to average the files
+                           with the same label, see average_replicates.
+                           Needs regex. (Default value = None)
+        :param threshold: outlier threshold of the robust average.
+                          (Default value = 5.)
         """
 
         self.data = pd.DataFrame()
@@ -137,6 +460,8 @@ class Spectra():
             # self.data = pd.concat((self.data, col), axis=1)
 
         self.data.sort_index(axis=1, inplace=True)
+        if replicates is not None:
+            self.average_replicates(replicates, threshold)
 
     @staticmethod
     def nearest(array, number):
@@ -165,6 +490,76 @@ class Spectra():
         """
         return Spectra.nearest(self.data.index, wavelength)
 
+    @staticmethod
+    def nearest_indices(array, numbers):
+        """Finds the positions of the nearest values in array to each of the
+        numbers, all at once.
+
+        :param array:
+        :param numbers:
+
+        """
+        array = np.asarray(array, dtype=float)
+        numbers = np.asarray(numbers, dtype=float)
+        return np.abs(array[:, np.newaxis] - numbers).argmin(axis=0)
+
+    def band_intensities(self, wavelengths, width=None):
+        """Returns the intensity of every column at each of the wavelengths
+        (nearest value), or, if width is given, its integral over a band of
+        that width centered at each wavelength.
+
+        :param wavelengths: list of wavelengths.
+        :param width: width of the bands in nm. (Default value = None)
+        :returns: pandas.DataFrame with one row per column and one column
+                  per wavelength.
+
+        """
+        x = np.asarray(self.data.index, dtype=float)
+        y = self.data.to_numpy(dtype=float)
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=float))
+        if width is None:
+            values = y[Spectra.nearest_indices(x, wavelengths)].T
+        else:
+            edges = Spectra.nearest_indices(
+                x, np.concatenate([wavelengths - width/2,
+                                   wavelengths + width/2]))
+            values = np.empty((y.shape[1], len(wavelengths)))
+            for i, (lo, hi) in enumerate(zip(edges[:len(wavelengths)],
+                                             edges[len(wavelengths):])):
+                band = y[lo:hi + 1]
+                dx = np.diff(x[lo:hi + 1])[:, np.newaxis]
+                values[:, i] = ((band[1:] + band[:-1])/2*dx).sum(axis=0)
+        return pd.DataFrame(values, index=self.data.columns,
+                            columns=wavelengths)
+
+    def ratio(self, numerator, denominator, width=None):
+        """Returns the ratio of the intensities at two wavelengths for every
+        column. See band_intensities.
+
+        :param numerator: wavelength of the numerator.
+        :param denominator: wavelength of the denominator.
+        :param width: width of the bands in nm. (Default value = None)
+
+        """
+        values = self.band_intensities([numerator, denominator],
+                                       width).to_numpy()
+        return pd.Series(values[:, 0]/values[:, 1], index=self.data.columns)
+
+    def generalized_polarization(self, blue=440, red=490, width=None):
+        """Returns the generalized polarization (Ib - Ir)/(Ib + Ir) of every
+        column, a quick estimate of the Laurdan relaxation that needs no
+        fit. See band_intensities.
+
+        :param blue: wavelength of the blue band. (Default value = 440)
+        :param red: wavelength of the red band. (Default value = 490)
+        :param width: width of the bands in nm. (Default value = None)
+
+        """
+        values = self.band_intensities([blue, red], width).to_numpy()
+        return pd.Series((values[:, 0] - values[:, 1]) /
+                         (values[:, 0] + values[:, 1]),
+                         index=self.data.columns)
+
     def plot_fixed_wavelength(self, wavelength, style=None):
         """Plots the specified wavelength (nearest value).
 
@@ -231,21 +626,51 @@ class Spectra():
         self.decorate_plot(ylabel="Norm. intensity (a.u.)")
         plt.ylim([0, 1])
 
-    def plot_maxima(self, style=None):
+    def track_peaks(self, method="parabolic", window=None, threshold=0.5):
+        """Finds the peak of every column at once. See peaks.track.
+
+        :param method: sub-grid method, "parabolic", "gaussian" or "grid".
+                       (Default value = "parabolic")
+        :param window: moving average window to smooth the spectra with.
+                       (Default value = None)
+        :param threshold: fraction of the maximum used for the centroids.
+                          (Default value = 0.5)
+        :returns: dict of arrays, one value per column.
+        """
+        return peaks.track(self.data.index, self.data.to_numpy(), method,
+                           window, threshold)
+
+    def plot_maxima(self, style=None, method="grid", window=None):
         """Plots the maximum wavelength vs. column.
 
         :param style: the style to use for the plot lines.
                       (Default value = None)
+        :param method: sub-grid method, see track_peaks.
+                       (Default value = "grid")
+        :param window: moving average window. (Default value = None)
 
         """
-        maxima = self.data.idxmax()
+        maxima = pd.Series(self.track_peaks(method, window)["position"],
+                           index=self.data.columns)
         maxima.plot(style=style)
         self.decorate_plot()
 
+    def process_blocks(self, blank=None, normalize=False, peaks=None,
+                       fit=None, jobs=1, block_size=None):
+        """Subtracts the blank, normalizes, tracks the peaks and fits the
+        columns in blocks, in jobs worker processes that share the data.
+        See chunked.process.
+
+        :returns: the peaks of every column as a DataFrame, or None.
+        """
+        return chunked.process(self, blank, normalize, peaks, fit, jobs,
+                               block_size)
+
     def substract_blank(self, blank):
         # if not np.array_equal(self.data, blank.data):
         #    interpolate = True
         for i in range(len(self.data.columns)):
-            f = interp1d(blank.data.index, blank.data.iloc[:, i], kind='cubic')
+            f = interpolate.interp1d(blank.data.index, blank.data.iloc[:, i],
+                                     kind='cubic')
             self.data.iloc[:, i] = self.data.iloc[:, i] - f(self.data.index)
             # blank.data.iloc[:, i]
@@ -16,15 +16,23 @@
 from .cibaalimporter import CibaalImporter
 import os
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 from .helpers import fit2ln, fithill, hillfun
 from .merofitter import MeroFitter
+from .spectra import average_replicates
 from glob import glob
+from .lazy import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
+
 
 class SpectraBuilder():
     
-    def __init__(self, files, tipo, wavelength):
+    def __init__(self, files, tipo, wavelength, replicates=None,
+                 threshold=5.):
+        """replicates: "mean", "median" or "robust" to average the files
+        with the same title, see spectra.average_replicates. The standard
+        deviations are kept in self.sd."""
         self.data = pd.DataFrame()
         self.path = os.path.sep.join(files[0].split(os.path.sep)[:-1])
         for file in files:
@@ -37,6 +45,10 @@ class SpectraBuilder():
         self.sanitizeColumns(lambda x: float("{:.2f}".format(int(x)*22/(90*2000)*1000)))
         self.data.sort_index(axis=1, inplace=True)
         self.data.index = pd.to_numeric(self.data.index)
+        self.sd = None
+        if replicates is not None:
+            self.data, self.sd, _ = average_replicates(self.data, replicates,
+                                                       threshold)
         self.normalize()
         self.wavelength = wavelength
     
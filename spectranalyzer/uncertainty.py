@@ -0,0 +1,198 @@
+# This file is part of SpectrAnalyzer.
+#
+# SpectrAnalyzer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SpectrAnalyzer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Standard errors of the quantities derived from the component areas.
+
+The areas and their gradients with respect to the fitted parameters are
+integrated with a fixed Gauss-Legendre rule using the analytic derivatives
+of lnmodel, and propagated with the covariance of the fit.
+"""
+
+import numpy as np
+from .lnmodel import lognormal, quadrature
+from .report import ReportBuilder
+from .water import WaterLN
+
+PARAMS = ('y0', 'vm', 'vmin', 'vmax')
+
+
+def component_values(fitter):
+    """Returns, for every component of the fitter, its kind ('ln', or
+    'water' for WaterLN) and a dict with the value of each of its parameters
+    and the index of the parameter in the covariance (None if fixed)."""
+    var_names = list(fitter.out.var_names)
+    components = []
+    for fun in fitter.multiln.lnfuns:
+        name = fun.name.replace('-', '')
+        values = {}
+        for pname in PARAMS:
+            if pname in fun.params:
+                fullname = f"{name}{pname}"
+                index = None
+                if fullname in var_names:
+                    index = var_names.index(fullname)
+                values[pname] = (fun.params[pname].value, index)
+        kind = 'water' if isinstance(fun, WaterLN) else 'ln'
+        components.append((kind, values))
+    return components
+
+
+def component_areas(components, x, samples=None, points=256):
+    """Areas of the components between x.min() and x.max() and their
+    gradients with respect to the fitted parameters.
+
+    :param components: as returned by component_values.
+    :param x: the wavelengths of the data.
+    :param samples: optional array (samples, parameters) of parameter
+                    vectors. If given, the areas of every sample are
+                    returned and no gradient is calculated.
+    :param points: number of nodes of the quadrature. (Default value = 256)
+    :returns: areas (components,) and jacobian (components, parameters),
+              or areas (samples, components).
+    """
+    xn, w = quadrature(np.min(x), np.max(x), points)
+    nparams = 0 if samples is not None else max(
+        [index + 1 for _, values in components
+         for _, index in values.values() if index is not None] + [0])
+    areas = []
+    jacobian = np.zeros((len(components), nparams))
+    for i, (kind, values) in enumerate(components):
+        args = {}
+        for pname, (value, index) in values.items():
+            if samples is not None and index is not None:
+                value = samples[:, index]
+                if kind == 'ln':
+                    value = value[:, np.newaxis]
+            args[pname] = value
+        if kind == 'water':
+            reference = (w*WaterLN.interpolator(xn)).sum()
+            areas.append(reference*np.asarray(args['y0']))
+            index = values['y0'][1]
+            if samples is None and index is not None:
+                jacobian[i, index] = reference
+            continue
+        lnargs = (args['y0'], args['vm'], args.get('vmin'), args.get('vmax'))
+        if samples is not None:
+            areas.append((w*lognormal(xn, *lnargs)).sum(axis=-1))
+            continue
+        y, grad = lognormal(xn, *lnargs, gradient=True)
+        areas.append((w*y).sum())
+        for pname, (_, index) in values.items():
+            if index is not None:
+                jacobian[i, index] = (w*grad[pname]).sum()
+    if samples is not None:
+        return np.stack(np.broadcast_arrays(*areas), axis=-1)
+    return np.asarray(areas), jacobian
+
+
+def stack_quantities(quantities, names, areas):
+    derived = quantities(names, areas)
+    return list(derived), np.stack(np.broadcast_arrays(*derived.values()),
+                                   axis=-1).astype(float)
+
+
+def propagate(fitter, quantities, samples=0, seed=None, points=256):
+    """Standard errors of the quantities derived from the areas of a fit.
+
+    :param fitter: a fitted LNFitter.
+    :param quantities: function receiving the component names and an array
+                       of areas (..., components) and returning a dict of
+                       derived quantities, as derived_quantities of the
+                       fitters.
+    :param samples: if greater than zero, the errors are the standard
+                    deviation of that many parameter vectors drawn from the
+                    covariance of the fit instead. (Default value = 0)
+    :param seed: seed for the samples. (Default value = None)
+    :param points: number of nodes of the quadrature. (Default value = 256)
+    :returns: dict mapping each quantity to its standard error. NaN if the
+              fit has no covariance.
+    """
+    names = [fun.name for fun in fitter.multiln.lnfuns]
+    x = np.asarray(fitter.data.index)
+    components = component_values(fitter)
+    covar = fitter.out.covar
+    areas, jacobian = component_areas(components, x, points=points)
+    keys, values = stack_quantities(quantities, names, areas)
+    if covar is None:
+        return dict(zip(keys, np.full(len(keys), np.nan)))
+
+    if samples:
+        rng = np.random.default_rng(seed)
+        best = np.array([fitter.out.params[name].value
+                         for name in fitter.out.var_names])
+        draws = rng.multivariate_normal(best, covar, size=samples)
+        sampled = component_areas(components, x, samples=draws,
+                                  points=points)
+        _, sampled = stack_quantities(quantities, names, sampled)
+        with np.errstate(invalid='ignore'):
+            return dict(zip(keys, np.nanstd(sampled, axis=0, ddof=1)))
+
+    # Gradient of the quantities with respect to the areas, by central
+    # differences of all of them at once.
+    steps = np.maximum(np.abs(areas), 1.)*1e-6
+    shifts = np.diag(steps)
+    _, upper = stack_quantities(quantities, names, areas + shifts)
+    _, lower = stack_quantities(quantities, names, areas - shifts)
+    gradient = ((upper - lower)/(2*steps[:, np.newaxis])).T
+    total = gradient @ jacobian
+    variance = np.einsum('ij,jk,ik->i', total, covar, total)
+    return dict(zip(keys, np.sqrt(variance)))
+
+
+class AreaQuantities():
+    """Mixin for the fitters whose report is derived from the areas of the
+    components. A class sets AREAS, the report names of the relative areas
+    (%) of its components in order, or leaves it None to report the areas
+    under the names of the components with their relative areas as
+    "<name>norm". ratios adds the quantities derived from those.
+    """
+    AREAS = None
+
+    def ratios(self, data):
+        """Quantities derived from the areas of derived_quantities."""
+        return {}
+
+    def derived_quantities(self, names, areas):
+        """Report quantities derived from the areas of the components.
+
+        :param names: the names of the components.
+        :param areas: array (..., components) of areas.
+        """
+        areas = np.moveaxis(np.asarray(areas, dtype=float), -1, 0)
+        relative = [area / sum(areas) * 100 for area in areas]
+        if self.AREAS is None:
+            data = dict(zip(names, areas))
+            data.update((f"{name}norm", area)
+                        for name, area in zip(names, relative))
+        else:
+            data = dict(zip(self.AREAS, relative))
+        data.update(self.ratios(data))
+        return data
+
+    def calculate_errors(self, samples=0, seed=None):
+        """Standard errors of the report quantities derived from the areas,
+        one row per fit. See propagate.
+
+        :param samples: number of Monte Carlo samples, 0 to propagate the
+                        covariance linearly. (Default value = 0)
+        :param seed: seed for the samples. (Default value = None)
+        """
+        errors = ReportBuilder()
+        for fit in self.fits:
+            errors.add_row(fit.data.name,
+                           propagate(fit.restore(), self.derived_quantities,
+                                     samples, seed))
+        self.errors = errors.to_dataframe()
+        return self.errors
@@ -13,35 +13,69 @@
 # You should have received a copy of the GNU General Public License
 # along with SpectrAnalyzer.  If not, see <https://www.gnu.org/licenses/>.
 
-from lmfit import Parameters
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-from scipy.integrate import quad
-from scipy import interpolate
 import os
+from .lazy import lazy_import
+
+lmfit = lazy_import("lmfit")
+plt = lazy_import("matplotlib.pyplot")
+integrate = lazy_import("scipy.integrate")
+interpolate = lazy_import("scipy.interpolate")
 
 exp = np.exp
 log = np.log
 
 
 class WaterLN():
+    # The reference spectrum and its interpolator are shared by every
+    # instance, they are loaded the first time a WaterLN is created.
+    reference = None
+    interpolator = None
+    # The last x evaluated and the reference interpolated there.
+    grid = {'x': None, 'y': None}
+
     def __init__(self, params=None):
-        path = os.path.dirname(os.path.realpath(__file__))
-        self.data = pd.read_csv(f"{path}{os.path.sep}normagua.csv",
-                                index_col=0)
-        self.params = Parameters()
-        self.params.add("y0", 1, min=0)
-        self.params.add("vm", 1, vary=False)
+        if WaterLN.reference is None:
+            WaterLN.load_reference()
+        self.data = WaterLN.reference
+        if params is None:
+            self.params = lmfit.Parameters()
+            self.params.add("y0", 1, min=0)
+            self.params.add("vm", 1, vary=False)
+        else:
+            self.params = params
         self.name = "Water"
 
+    @staticmethod
+    def load_reference():
+        path = os.path.dirname(os.path.realpath(__file__))
+        WaterLN.reference = pd.read_csv(f"{path}{os.path.sep}normagua.csv",
+                                        index_col=0)
+        WaterLN.grid = {'x': None, 'y': None}
+        WaterLN.interpolator = interpolate.interp1d(
+            WaterLN.reference.index, WaterLN.reference.iloc[:, 0],
+            fill_value='extrapolate')
+
     def evaluate(self, x):
         y0 = self.params["y0"].value
-        f = interpolate.interp1d(self.data.index, self.data.iloc[:, 0] * y0,
-                                 fill_value='extrapolate')
-        self.y = f(x)
+        self.y = WaterLN.shape(x) * y0
         return self.y
 
+    def basis(self, x):
+        """The reference with y0 = 1."""
+        return WaterLN.shape(x)
+
+    @staticmethod
+    def shape(x):
+        """The reference interpolated at x, kept for the last x array."""
+        if not isinstance(x, np.ndarray) or x.ndim == 0:
+            return WaterLN.interpolator(x)
+        if WaterLN.grid['x'] is not x:
+            WaterLN.grid['y'] = WaterLN.interpolator(x)
+            WaterLN.grid['x'] = x
+        return WaterLN.grid['y']
+
     def plot(self, x):
         y = self.evaluate(x)
         plt.plot(x, y)
@@ -52,5 +86,5 @@ class WaterLN():
         plt.plot(x, y)
 
     def calculate_area(self, x):
-        area = quad(self.evaluate, x.min(), x.max(), args=())[0]
+        area = integrate.quad(self.evaluate, x.min(), x.max(), args=())[0]
         return area
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from spectranalyzer import MeroFitter, Spectra
+from spectranalyzer.lnfun import LNFun
+from spectranalyzer.peaks import track
+
+
+def band(x, y0, vm, vmin, vmax):
+    fun = LNFun()
+    fun.set_param_minmax(y0, vm, vmin, vmax)
+    return fun.evaluate(x)
+
+
+def titration(columns=10, seed=1):
+    """MC540 spectra with a different noise level every third column."""
+    x = np.arange(520., 700., 1.)
+    rng = np.random.default_rng(seed)
+    data = {i: band(x, 0.5 - 0.02*i, 573, 554, 594) +
+            band(x, 0.5 + 0.02*i, 612, 594, 640) +
+            rng.normal(0, 0.01*(1 + i % 3), x.size) + 0.05
+            for i in range(columns)}
+    return pd.DataFrame(data, index=x)
+
+
+def fitter(data, name):
+    fitter = MeroFitter(name, xlabel='c')
+    fitter.data = data.copy()
+    fitter.smooth_data(weights=True)
+    return fitter
+
+
+def test_chunked_matches_serial():
+    data = titration()
+    blank = Spectra()
+    blank.data = pd.DataFrame(0.05, index=data.index, columns=data.columns)
+
+    serial = fitter(data, 'serial')
+    serial.substract_blank(blank)
+    serial.fit_all_columns(vary=False)
+    serial_peaks = track(serial.data.index, serial.data.values)
+
+    chunked = fitter(data, 'chunked')
+    found = chunked.process_blocks(blank=blank, normalize=True, peaks=True,
+                                   fit={'vary': False}, jobs=2,
+                                   block_size=3)
+
+    pd.testing.assert_frame_equal(chunked.data, serial.data)
+    pd.testing.assert_frame_equal(chunked.normdata,
+                                  serial.data/serial.data.max())
+    for key, values in serial_peaks.items():
+        np.testing.assert_allclose(found[key], values)
+    pd.testing.assert_frame_equal(chunked.report, serial.report,
+                                  check_exact=False, rtol=1e-9)
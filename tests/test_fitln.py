@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from spectranalyzer.helpers import default2ln, fit2ln, fitln, params_array
+from spectranalyzer.lnmodel import bands
+
+
+def spectra(seed=0):
+    """Two-band spectra with different amplitudes and maxima, on a
+    wavenumber grid as fit2ln expects."""
+    x = 10**7/np.linspace(520., 680., 161)
+    true = params_array(default2ln())[0]
+    rng = np.random.default_rng(seed)
+    columns = []
+    for k in range(3):
+        values = true.copy()
+        values[:, 0] *= [1 + 0.2*k, 1 - 0.1*k]
+        values[0, 1] += 100*k
+        columns.append(bands(x, values) + 0.005*rng.normal(size=x.size))
+    return pd.DataFrame(np.column_stack(columns), index=x)
+
+
+def test_fitln_matches_lmfit():
+    data = spectra()
+    initial, lower, upper = params_array(default2ln())
+    values, info = fitln(data.index, data.values, initial, lower, upper)
+    assert info["converged"].all()
+    for i, column in enumerate(data):
+        out = fit2ln(data[column])
+        np.testing.assert_allclose(info["chisqr"][i], out.chisqr, rtol=1e-4)
+        np.testing.assert_allclose(values[i], params_array(out.params)[0],
+                                   rtol=1e-4)
+
+
+def test_fitln_bad_start_does_not_converge():
+    data = spectra()
+    params = default2ln()
+    # Both bands far from the data, where they are flat at zero.
+    params["vma"].value = params["vmb"].value = 10**7/400
+    initial, lower, upper = params_array(params)
+    values, info = fitln(data.index, data.values, initial, lower, upper)
+    assert not info["converged"].any()
+    assert (info["stop"] == "step").all()
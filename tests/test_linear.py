@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from spectranalyzer import MeroFitter
+from spectranalyzer.lnfun import LNFun
+
+
+def band(x, y0, vm, vmin, vmax):
+    fun = LNFun()
+    fun.set_param_minmax(y0, vm, vmin, vmax)
+    return fun.evaluate(x)
+
+
+def titration(columns=6, seed=1):
+    """Two MC540 bands whose amplitudes change along the titration. Both
+    stay below the maximum of the data, the upper bound of the presets."""
+    x = np.arange(520., 700., 3.)
+    rng = np.random.default_rng(seed)
+    data = {i: band(x, 0.5 - 0.05*i, 573, 554, 594) +
+            band(x, 0.5 + 0.05*i, 612, 594, 640) +
+            rng.normal(0, 0.003, x.size) for i in range(columns)}
+    return pd.DataFrame(data, index=x)
+
+
+def fit(data, linear, vary=False):
+    fitter = MeroFitter('linear', xlabel='c')
+    fitter.data = data
+    fitter.fit_all_columns(vary=vary, linear=linear)
+    return fitter.fits
+
+
+def test_fit_linear_matches_nonlinear_fit():
+    data = titration()
+    for linear, nonlinear in zip(fit(data, True), fit(data, False)):
+        np.testing.assert_allclose(linear.out.chisqr, nonlinear.out.chisqr,
+                                   rtol=1e-6)
+        for name in nonlinear.out.var_names:
+            np.testing.assert_allclose(linear.out.params[name].value,
+                                       nonlinear.out.params[name].value,
+                                       rtol=1e-4)
+            np.testing.assert_allclose(linear.out.params[name].stderr,
+                                       nonlinear.out.params[name].stderr,
+                                       rtol=1e-4)
+
+
+def test_create_fitters_checks_every_fitter():
+    fitter = MeroFitter('mixed', xlabel='c')
+    fitter.data = titration(4)
+    create_fitter = fitter.create_fitter
+    # Only the first column has a nonlinear model.
+    fitter.create_fitter = lambda col, interphase=False, vary=True: \
+        create_fitter(col, interphase, vary=vary or col == 0)
+    fitters = dict(fitter.create_fitters(vary=False))
+    assert not fitters[0].is_linear() and fitters[0].out is None
+    assert all(fitters[col].is_linear() and fitters[col].out is not None
+               for col in (1, 2, 3))
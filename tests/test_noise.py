@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from spectranalyzer.noise import noise_weights
+from spectranalyzer.spectra import Spectra
+
+
+def band(x):
+    return 1000*np.exp(-((x - 500)/30)**2) + 5
+
+
+def test_poisson_weights():
+    y = np.column_stack([[100., 4., 0., np.nan], [400., 16., 1., 4.]])
+    weights = noise_weights(y)
+    # 1/sqrt(y), with y raised to 1% of the maximum of its column.
+    np.testing.assert_allclose(weights, [[0.1, 0.05], [0.5, 0.25],
+                                         [1., 0.5], [np.nan, 0.5]])
+
+
+def test_replicates_weights():
+    sd = np.array([[2., 1.], [0.1, np.nan], [4., 2.]])
+    weights = noise_weights(np.ones(sd.shape), "replicates", sd=sd)
+    # Raised to 10% of the median deviation, the median when missing.
+    np.testing.assert_allclose(weights, [[0.5, 1.], [5., 1/1.5], [0.25, 0.5]])
+
+
+def test_weights_need_an_estimate():
+    with pytest.raises(ValueError):
+        noise_weights(np.ones((3, 2)), "replicates",
+                      sd=np.column_stack([[1., 2., 3.], [np.nan]*3]))
+    with pytest.raises(ValueError):
+        noise_weights(np.ones(3), "gaussian")
+
+
+@pytest.mark.parametrize("proportional", [0., 0.02])
+def test_snr_weights_follow_the_noise(proportional):
+    """Noise of 2 units plus a proportional part: the weights must be the
+    inverse of its standard deviation at every intensity."""
+    x = np.linspace(400., 600., 401)
+    rng = np.random.default_rng(0)
+    clean = band(x)
+    sigma = 2 + proportional*clean
+    columns = [clean + sigma*rng.normal(size=x.size) for _ in range(4)]
+    spectra = Spectra()
+    spectra.data = pd.DataFrame(np.column_stack(columns), index=x)
+    spectra.smooth_data(window=31, order=3)
+    weights = spectra.snr_weights().to_numpy()
+    ratio = weights*sigma[:, np.newaxis]
+    # The smoothing removes part of the noise, the ratio is only constant.
+    assert np.all(np.abs(ratio/np.median(ratio) - 1) < 0.3)
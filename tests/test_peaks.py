@@ -0,0 +1,35 @@
+import numpy as np
+from spectranalyzer.peaks import track
+
+
+def bands(centers, width=20.):
+    """Gaussian bands centred between the points of a 2 nm grid."""
+    x = np.arange(400., 600., 2.)
+    y = np.column_stack([np.exp(-((x - center)/width)**2)
+                         for center in centers])
+    return x, y
+
+
+def test_gaussian_finds_band_centre():
+    centers = [450.3, 500., 531.7]
+    x, y = bands(centers)
+    peaks = track(x, y, method="gaussian")
+    np.testing.assert_allclose(peaks["position"], centers, atol=1e-9)
+    # The points above the threshold are not symmetric about the centre.
+    np.testing.assert_allclose(peaks["centroid"], centers, atol=0.5)
+    assert np.all(np.abs(peaks["maximum"] - centers) <= 1.)
+
+
+def test_parabolic_stays_near_band_centre():
+    centers = [450.3, 500., 531.7]
+    x, y = bands(centers)
+    y[10, 0] = np.nan
+    peaks = track(x, y)
+    np.testing.assert_allclose(peaks["position"], centers, atol=0.05)
+
+
+def test_peak_at_the_edge_stays_on_the_grid():
+    x, y = bands([390.])
+    peaks = track(x, y)
+    assert peaks["index"][0] == 0
+    assert peaks["position"][0] == x[0]
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from spectranalyzer.spectra import average_replicates
+
+
+def triplicates(noise=0.02, seed=0):
+    """Clean triplicates of a band with noise proportional to the
+    intensity."""
+    x = np.linspace(400., 600., 201)
+    band = 1000*np.exp(-((x - 500)/30)**2) + 5
+    rng = np.random.default_rng(seed)
+    columns = [band*(1 + noise*rng.normal(size=x.size)) for _ in range(3)]
+    return pd.DataFrame(np.column_stack(columns), index=x,
+                        columns=[1., 1., 1.])
+
+
+def test_robust_keeps_heteroscedastic_data():
+    data = triplicates()
+    averages, sd, counts = average_replicates(data, "robust")
+    assert (counts == 3).all().all()
+    np.testing.assert_allclose(averages[1.], data.mean(axis=1))
+
+
+def test_robust_rejects_outliers():
+    data = triplicates()
+    data.iloc[90:95, 1] *= 1.5
+    data.iloc[10:15, 2] += 10
+    averages, sd, counts = average_replicates(data, "robust")
+    assert (counts.iloc[90:95] == 2).all().all()
+    assert (counts.iloc[10:15] == 2).all().all()
+    assert counts[1.].sum() == 3*len(data) - 10
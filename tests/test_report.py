@@ -0,0 +1,17 @@
+import pandas as pd
+from spectranalyzer.report import ReportBuilder
+
+
+def test_new_column_rewrites_header(tmp_path):
+    filename = tmp_path / "report.csv"
+    with ReportBuilder(str(filename)) as builder:
+        builder.add_row(0.1, {"Area": 1., "Chisqr": 0.5})
+        builder.add_row(0.2, {"Area": 2., "Chisqr": 0.4, "WindowMin": 450.})
+        builder.add_row(0.5, {"Chisqr": 0.3})
+        report = builder.to_dataframe()
+    written = pd.read_csv(filename, index_col=0)
+    assert list(written.columns) == ["Area", "Chisqr", "WindowMin"]
+    assert list(written.index) == [0.1, 0.2, 0.5]
+    pd.testing.assert_frame_equal(written, report, check_dtype=False)
+    assert written.isna().sum().to_dict() == {"Area": 1, "Chisqr": 0,
+                                             "WindowMin": 2}
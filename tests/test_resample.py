@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from spectranalyzer.spectra import Spectra
+
+
+def band(x, center=500.):
+    return 1000*np.exp(-((x - center)/30)**2) + 5
+
+
+def mismatched():
+    """Spectra on different grids, concatenated as by load_csv_data: the
+    union of the grids, with NaNs where a column has no point."""
+    first = np.arange(400., 600.1, 1.)
+    second = np.arange(402.5, 598., 2.)
+    data = pd.concat((pd.DataFrame({0.1: band(first)}, index=first),
+                      pd.DataFrame({0.2: band(second, 510.)}, index=second)),
+                     axis=1, sort=True)
+    assert data.isna().any().all()
+    spectra = Spectra()
+    spectra.data = data
+    return spectra
+
+
+@pytest.mark.parametrize("kind", ["linear", "cubic", "bin"])
+def test_resample_leaves_no_nans(kind):
+    spectra = mismatched()
+    spectra.resample(kind=kind)
+    grid = spectra.data.index
+    assert not spectra.data.isna().any().any()
+    assert grid.min() >= 402.5 and grid.max() <= 598.
+    np.testing.assert_allclose(np.diff(grid), 2.)
+
+
+def test_resample_interpolates_the_bands():
+    spectra = mismatched()
+    spectra.resample()
+    grid = np.asarray(spectra.data.index)
+    # The linear interpolation of a band sampled every 2 nm.
+    np.testing.assert_allclose(spectra.data[0.2], band(grid, 510.),
+                               rtol=0.02)
+    np.testing.assert_allclose(spectra.data[0.1], band(grid), rtol=0.01)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from spectranalyzer.lnfitter import LNFitter
+from spectranalyzer.lnfun import LNFun
+from spectranalyzer.uncertainty import propagate
+
+
+def spectrum(seed=0):
+    """Monomer and dimer bands of MC540 in water, with noise."""
+    x = np.arange(520., 700., 2.)
+    y = np.zeros(x.size)
+    for y0, vm, vmin, vmax in ((0.6, 573, 554, 594), (0.5, 612, 594, 640)):
+        fun = LNFun()
+        fun.set_param_minmax(y0, vm, vmin, vmax)
+        y += fun.evaluate(x)
+    rng = np.random.default_rng(seed)
+    return pd.Series(y + rng.normal(0, 0.003, x.size), index=x)
+
+
+def fractions(names, areas):
+    return {"Monomer": areas[..., 0]/areas.sum(axis=-1),
+            "Total": areas.sum(axis=-1)}
+
+
+def test_monte_carlo_matches_linear_propagation():
+    fitter = LNFitter.from_preset(spectrum(), "MC540-Water")
+    fitter.fit()
+    linear = propagate(fitter, fractions)
+    sampled = propagate(fitter, fractions, samples=20000, seed=1)
+    assert all(linear[key] > 0 for key in linear)
+    for key in linear:
+        np.testing.assert_allclose(sampled[key], linear[key], rtol=0.05)